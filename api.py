@@ -0,0 +1,261 @@
+import asyncio
+import json
+import logging
+import os
+import uuid
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import attempt_log
+import grading
+import quiz_service
+import rate_limit
+import session_memory
+import telemetry
+import uploads
+
+
+# Headless HTTP API over the same generation pipeline as the Streamlit app:
+#   POST /v1/quizzes/topic     {"topic", "num_questions", "quiz_type", "quiz_level", "language", "session_id", "fresh"}
+#   POST /v1/quizzes/catalog   {"subject", "sub_field", ...the same parameters}
+#   POST /v1/quizzes/document  PDF body (application/pdf, parameters in the query string)
+#                              or multipart/form-data with a "file" field and the parameters
+#   POST /v1/grade             {"questions", "answers": {"q1": ..., ...}, optional "session_id" and
+#                              "latencies": {"q1": seconds, ...}}; every grading is added to the attempt log
+#   GET  /v1/catalog, /v1/memory, /healthz, /metrics
+# Quiz endpoints answer with one JSON document, or stream one JSON object per line
+# ({"question": ...} as each is accepted, then {"done": true, ...}) when the request
+# sends "Accept: application/x-ndjson".
+HOST = os.getenv("QUIZ_API_HOST", "127.0.0.1")
+PORT = int(os.getenv("QUIZ_API_PORT", "8080"))
+# Quizzes generated at once by one API process; each fans out into concurrent model calls
+# on the planner's own threads, so the event loop itself never blocks
+MAX_QUIZZES = int(os.getenv("QUIZ_API_MAX_QUIZZES", "32"))
+# Same default as the Streamlit app and batch_cli (uploads.MAX_BYTES), so a thin client is
+# not refused a PDF the app itself accepts
+MAX_UPLOAD_BYTES = int(os.getenv("QUIZ_API_MAX_UPLOAD_BYTES", str(uploads.MAX_BYTES)))
+
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+logger = logging.getLogger(__name__)
+
+
+def _error(status, message):
+    return status(text=json.dumps({"error": message}), content_type="application/json")
+
+
+def quiz_parameters(data):
+    try:
+        parameters = quiz_service.quiz_parameters(data)
+    except ValueError as e:
+        raise _error(web.HTTPBadRequest, str(e))
+    fresh = str(data.get("fresh", "0")).lower() in ("1", "true")
+    return dict(parameters, use_cache=not fresh)
+
+
+async def json_body(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        raise _error(web.HTTPBadRequest, "Request body must be JSON")
+    if not isinstance(data, dict):
+        raise _error(web.HTTPBadRequest, "Request body must be a JSON object")
+    return data
+
+
+async def run_quiz(request, session_id, num_questions, generate):
+    # generate(history, on_question) is the blocking pipeline; it runs on the executor
+    # while this coroutine relays questions to the client as they are accepted
+    app = request.app
+    loop = asyncio.get_running_loop()
+    session_id = str(session_id or uuid.uuid4().hex)
+    # One quiz at a time per session, so its history and dedup index stay consistent
+    lock = app["session_locks"].setdefault(session_id, asyncio.Lock())
+
+    def call(on_question):
+        return generate(quiz_service.get_history(session_id), on_question)
+
+    def summary(questions):
+        return {"done": True, "session_id": session_id, "requested": num_questions, "generated": len(questions)}
+
+    async with lock:
+        if "application/x-ndjson" not in request.headers.get("Accept", ""):
+            try:
+                questions = await loop.run_in_executor(app["executor"], call, None)
+            except json.JSONDecodeError:
+                raise _error(web.HTTPBadGateway, "Failed to parse the quiz questions. Please try again.")
+            except rate_limit.RETRYABLE_ERRORS:
+                raise _error(web.HTTPServiceUnavailable, "The model is busy right now. Please try again in a minute.")
+            return web.json_response(dict(summary(questions), questions=questions))
+
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        arrivals = asyncio.Queue()
+        finished = object()
+        on_question = lambda q: loop.call_soon_threadsafe(arrivals.put_nowait, q)
+        future = loop.run_in_executor(app["executor"], call, on_question)
+        future.add_done_callback(lambda _: arrivals.put_nowait(finished))
+        while (q := await arrivals.get()) is not finished:
+            await response.write(json.dumps({"question": q}, ensure_ascii=False).encode("utf-8") + b"\n")
+        try:
+            event = summary(future.result())
+        except json.JSONDecodeError:
+            event = {"error": "Failed to parse the quiz questions. Please try again."}
+        except rate_limit.RETRYABLE_ERRORS:
+            event = {"error": "The model is busy right now. Please try again in a minute."}
+        except Exception as e:
+            logger.exception("Quiz generation failed")
+            event = {"error": f"Quiz generation failed: {e}"}
+        await response.write(json.dumps(event).encode("utf-8") + b"\n")
+        await response.write_eof()
+        return response
+
+
+async def topic_quiz(request):
+    data = await json_body(request)
+    parameters = quiz_parameters(data)
+    topic = str(data.get("topic", "")).strip()
+    if not topic:
+        raise _error(web.HTTPBadRequest, "topic is required")
+    generate = lambda history, on_question: quiz_service.topic_quiz(history, topic, on_question=on_question, **parameters)
+    return await run_quiz(request, data.get("session_id"), parameters["num_questions"], generate)
+
+
+async def catalog_quiz(request):
+    data = await json_body(request)
+    parameters = quiz_parameters(data)
+    subject, sub_field = data.get("subject"), data.get("sub_field")
+    if sub_field not in quiz_service.SUB_OPTIONS.get(subject, ['Select.....'])[1:]:
+        raise _error(web.HTTPBadRequest, "subject and sub_field must name an entry of GET /v1/catalog")
+    generate = lambda history, on_question: quiz_service.catalog_quiz(history, subject, sub_field, on_question=on_question, **parameters)
+    return await run_quiz(request, data.get("session_id"), parameters["num_questions"], generate)
+
+
+async def spool_upload(request):
+    # Streams the PDF (the raw body, or the multipart "file" field) to a temporary file in
+    # chunks; returns the uploads.Document and the quiz parameters sent with it
+    loop = asyncio.get_running_loop()
+    spooler = uploads.Spooler(MAX_UPLOAD_BYTES)
+    fields = request.query
+    try:
+        if request.content_type == "multipart/form-data":
+            fields = {}
+            found = False
+            async for part in await request.multipart():
+                if part.name == "file" and part.filename is not None:
+                    found = True
+                    while chunk := await part.read_chunk(uploads.CHUNK_BYTES):
+                        await loop.run_in_executor(request.app["executor"], spooler.write, chunk)
+                else:
+                    fields[part.name] = await part.text()
+            if not found:
+                raise _error(web.HTTPBadRequest, "multipart requests need a 'file' field")
+        else:
+            async for chunk in request.content.iter_chunked(uploads.CHUNK_BYTES):
+                await loop.run_in_executor(request.app["executor"], spooler.write, chunk)
+        return spooler.finish(), fields
+    except uploads.UploadError as e:
+        if spooler.size > MAX_UPLOAD_BYTES:
+            raise web.HTTPRequestEntityTooLarge(MAX_UPLOAD_BYTES, spooler.size, text=json.dumps({"error": str(e)}),
+                                                content_type="application/json")
+        raise _error(web.HTTPBadRequest, "The request contains no document")
+    except BaseException:
+        spooler.abort()
+        raise
+
+
+async def document_quiz(request):
+    document, fields = await spool_upload(request)
+    try:
+        parameters = quiz_parameters(fields)
+        await asyncio.get_running_loop().run_in_executor(request.app["executor"], uploads.check_pages, document)
+    except uploads.UploadError as e:
+        document.close()
+        raise _error(web.HTTPBadRequest, str(e))
+    except BaseException:
+        document.close()
+        raise
+
+    def generate(history, on_question):
+        # The temporary file is only needed until the text is extracted (and cached)
+        try:
+            text = quiz_service.document_text(document)
+        finally:
+            document.close()
+        return quiz_service.document_quiz(history, text, document.key, on_question=on_question, **parameters)
+    return await run_quiz(request, fields.get("session_id"), parameters["num_questions"], generate)
+
+
+async def grade(request):
+    data = await json_body(request)
+    questions, answers = data.get("questions"), data.get("answers", {})
+    if not isinstance(questions, list) or not all(isinstance(q, dict) and "question" in q and "answer" in q for q in questions):
+        raise _error(web.HTTPBadRequest, "questions must be a list of objects with 'question' and 'answer'")
+    if not isinstance(answers, dict):
+        raise _error(web.HTTPBadRequest, "answers must map 'q1', 'q2', ... to the chosen options")
+    latencies = data.get("latencies") or {}
+    if not isinstance(latencies, dict) or not all(isinstance(v, (int, float)) for v in latencies.values()):
+        raise _error(web.HTTPBadRequest, "latencies must map 'q1', 'q2', ... to seconds")
+    results, score = grading.grade_answers(questions, answers)
+    # record() writes a Parquet file now and then, so it stays off the event loop
+    await asyncio.get_running_loop().run_in_executor(
+        request.app["executor"], attempt_log.log.record, str(data.get("session_id") or "api"), questions, answers, latencies)
+    return web.json_response({"results": results, "score": score, "total": len(questions)})
+
+
+async def catalog(request):
+    return web.json_response({
+        "quiz_types": quiz_service.QUIZ_TYPES,
+        "quiz_levels": quiz_service.QUIZ_LEVELS,
+        "languages": quiz_service.LANGUAGES,
+        "subjects": {subject: sub_fields[1:] for subject, sub_fields in quiz_service.SUB_OPTIONS.items()},
+    })
+
+
+async def healthz(request):
+    return web.json_response({"status": "ok"})
+
+
+async def memory(request):
+    # Per-session and process-wide memory breakdown (see session_memory)
+    report = await asyncio.get_running_loop().run_in_executor(request.app["executor"], session_memory.manager.report)
+    return web.json_response(report)
+
+
+async def metrics(request):
+    return web.Response(text=telemetry.metrics.render_prometheus(), content_type="text/plain")
+
+
+async def on_startup(app):
+    quiz_service.start_warmer()
+
+
+async def on_cleanup(app):
+    app["executor"].shutdown(wait=False, cancel_futures=True)
+
+
+def create_app():
+    app = web.Application(client_max_size=MAX_UPLOAD_BYTES)
+    app["executor"] = ThreadPoolExecutor(max_workers=MAX_QUIZZES, thread_name_prefix="quiz")
+    app["session_locks"] = weakref.WeakValueDictionary()
+    app.add_routes([
+        web.post("/v1/quizzes/topic", topic_quiz),
+        web.post("/v1/quizzes/catalog", catalog_quiz),
+        web.post("/v1/quizzes/document", document_quiz),
+        web.post("/v1/grade", grade),
+        web.get("/v1/catalog", catalog),
+        web.get("/v1/memory", memory),
+        web.get("/healthz", healthz),
+        web.get("/metrics", metrics),
+    ])
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+if __name__ == '__main__':
+    web.run_app(create_app(), host=HOST, port=PORT)
@@ -0,0 +1,73 @@
+import json
+import os
+import urllib.error
+import urllib.parse
+import urllib.request
+
+
+# When QUIZ_API_URL is set (e.g. http://127.0.0.1:8080), the Streamlit app is a thin
+# client of the quiz API in api.py instead of generating quizzes in its own process.
+API_URL = os.getenv("QUIZ_API_URL", "").rstrip("/")
+TIMEOUT = float(os.getenv("QUIZ_API_TIMEOUT", "300"))
+
+
+class ApiError(Exception):
+    pass
+
+
+def _post(path, body, content_type, query=None, length=None):
+    # body: bytes, or a binary file sent in chunks (length: its size in bytes)
+    url = f"{API_URL}{path}"
+    if query:
+        url += "?" + urllib.parse.urlencode(query)
+    headers = {"Content-Type": content_type, "Accept": "application/x-ndjson, application/json"}
+    if length is not None:
+        headers["Content-Length"] = str(length)
+    request = urllib.request.Request(url, data=body, method="POST", headers=headers)
+    try:
+        return urllib.request.urlopen(request, timeout=TIMEOUT)
+    except urllib.error.HTTPError as e:
+        try:
+            message = json.loads(e.read())["error"]
+        except (ValueError, KeyError, TypeError):
+            message = f"HTTP {e.code}"
+        raise ApiError(message) from e
+    except urllib.error.URLError as e:
+        raise ApiError(f"Quiz API at {API_URL} is unreachable: {e.reason}") from e
+
+
+def generate_quiz(kind, session_id, inputs, num_questions, quiz_type, quiz_level, language, use_cache=True, on_question=None):
+    # kind: "document" (inputs: data, an uploads.Document), "catalog" (subject, sub_field) or "topic" (topic)
+    # The quiz streams back as one JSON object per line; on_question sees each question
+    # as soon as its line arrives
+    parameters = {"session_id": session_id, "num_questions": num_questions, "quiz_type": quiz_type,
+                  "quiz_level": quiz_level, "language": language, "fresh": int(not use_cache)}
+    if kind == "document":
+        with inputs["data"].open() as document:
+            response = _post("/v1/quizzes/document", document, "application/pdf", parameters, inputs["data"].size)
+    else:
+        body = json.dumps(dict(parameters, **inputs)).encode("utf-8")
+        response = _post(f"/v1/quizzes/{kind}", body, "application/json")
+
+    questions = []
+    with response:
+        for line in response:
+            if not line.strip():
+                continue
+            event = json.loads(line)
+            if "error" in event:
+                raise ApiError(event["error"])
+            if "question" in event:
+                questions.append(event["question"])
+                if on_question:
+                    on_question(event["question"])
+    return questions
+
+
+def grade_answers(questions, user_answers, session_id=None, latencies=None):
+    # dict() turns quiz_items.Question objects back into plain JSON objects
+    body = json.dumps({"questions": [dict(q) for q in questions], "answers": user_answers, "session_id": session_id,
+                       "latencies": latencies or {}}).encode("utf-8")
+    with _post("/v1/grade", body, "application/json") as response:
+        graded = json.load(response)
+    return graded["results"], graded["score"]
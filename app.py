@@ -1,95 +1,249 @@
 import streamlit as st
 import os
 import json
-from PyPDF2 import PdfReader
+import time
+import uuid
+import logging
 from dotenv import load_dotenv
-from google.generativeai import GenerativeModel
 
-
-# Load environment variables
+# Load environment variables before the app's modules, which read their settings on import
 load_dotenv()
+
+import attempt_log
+import grading
+import quiz_items
+import telemetry
+import uploads
+import quiz_service
+import api_client
+import rate_limit
+import session_memory
+
+
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 os.environ["LANGCHAIN_API_KEY"] = os.getenv("LANGCHAIN_API_KEY")
 os.environ["LANGCHAIN_TRACING_V2"] = "true"
 
-# Configure Generative AI model
-def get_gemini_response(prompt):
-    model = GenerativeModel('gemini-1.5-flash', generation_config={"response_mime_type": "application/json"})
-    response = model.generate_content(prompt)
-    return response.text
-
-def get_pdf_text(pdf_file):
-    pdf_reader = PdfReader(pdf_file)
-    raw_text = ""
-    for page in pdf_reader.pages:
-        raw_text += page.extract_text()
-    return raw_text
+# Questions per page of the quiz (0 puts every question on one page)
+QUIZ_PAGE_SIZE = int(os.getenv("QUIZ_PAGE_SIZE", "10"))
+
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+logger = logging.getLogger(__name__)
+
+def get_document(pdf_file):
+    # Spools the upload to a temporary file once per uploaded file and checks it against the
+    # size and page limits; returns None, after saying why, when the file is rejected
+    spooled = st.session_state.get('document')
+    if not spooled or spooled[0] != pdf_file.file_id:
+        if spooled and spooled[1]:
+            spooled[1].close()
+        document = None
+        try:
+            pdf_file.seek(0)
+            document = uploads.spool(pdf_file)
+            uploads.check_pages(document)
+            spooled = (pdf_file.file_id, document, None)
+        except uploads.UploadError as e:
+            if document:
+                document.close()
+            spooled = (pdf_file.file_id, None, str(e))
+        st.session_state.document = spooled
+    if spooled[2]:
+        st.sidebar.error(spooled[2])
+    return spooled[1]
+
+def get_pdf_text(document):
+    return quiz_service.document_text(document)
+
+def read_document(pdf_file, document):
+    # Extracts (and summarizes, for long documents) once per uploaded file, so Generate Quiz
+    # finds the text and its digest in the caches. Failures are remembered rather than retried
+    # on every rerun: a document whose text cannot be extracted is not offered for a quiz, and
+    # one that cannot be summarized is quizzed on its full text. Returns whether it can be quizzed.
+    read = st.session_state.get('document_read')
+    if not read or read[0] != pdf_file.file_id:
+        error = warning = None
+        with st.spinner('Reading the document...'):
+            try:
+                text = get_pdf_text(document)
+            except Exception as e:
+                logger.warning("Extracting the uploaded document's text failed", exc_info=True)
+                error = f"The text of the document could not be extracted ({e}). Please upload another file."
+            else:
+                try:
+                    quiz_service.document_context(text, get_session_id(), fallback=False)
+                except Exception:
+                    logger.warning("Summarizing the uploaded document failed", exc_info=True)
+                    warning = "The document could not be summarized; quizzes will be generated from its full text."
+        read = (pdf_file.file_id, error, warning)
+        st.session_state.document_read = read
+    if read[1]:
+        st.sidebar.error(read[1])
+    elif read[2]:
+        st.sidebar.warning(read[2])
+    return not read[1]
 
 def get_quiz_parameters():
     st.sidebar.title('Quiz Parameters')
     num_questions = st.sidebar.slider('Number of questions: ', min_value=1, max_value=50, value=1)
-    quiz_type = st.sidebar.selectbox('Type of Quiz: ', ('Select.....', 'Multiple-Choice', 'True-False'))
-    quiz_level = st.sidebar.selectbox('Quiz Level: ', ('Select.....', 'Easy', 'Medium', 'Hard'))
-    language = st.sidebar.selectbox('Quiz Language: ', ('Select.....', 'English', 'Urdu'))
+    quiz_type = st.sidebar.selectbox('Type of Quiz: ', ('Select.....',) + quiz_service.QUIZ_TYPES)
+    quiz_level = st.sidebar.selectbox('Quiz Level: ', ('Select.....',) + quiz_service.QUIZ_LEVELS)
+    language = st.sidebar.selectbox('Quiz Language: ', ('Select.....',) + quiz_service.LANGUAGES)
+    st.sidebar.checkbox('Always generate fresh questions', key='fresh_questions',
+                        help='Skip previously generated questions for the same parameters and ask the model again.')
     return num_questions, quiz_type, quiz_level, language
 
 def get_sub_options(main_option):
-    sub_options = {
-        'Machine Learning': ['Select.....', 'Supervised Learning', 'Unsupervised Learning', 'Semi-Supervised Learning', 'Reinforcement Learning'],
-        'Deep Learning': ['Select.....', 'Artificial Neural Networks (ANNs)', 'Convolutional Neural Networks (CNNs)', 'Recurrent Neural Networks (RNNs)'],
-        'Mathematics': ['Select.....', 'Linear Algebra', 'Calculus', 'Matrices', 'Vectors'],
-        'Statistics': ['Select.....', 'Descriptive', 'Probability', 'Inferential']
-    }
-    return sub_options.get(main_option, ['Select.....'])
-
-def handle_quiz_generation(prompt):
-    response = get_gemini_response(prompt)
+    return quiz_service.SUB_OPTIONS.get(main_option, ['Select.....'])
+
+def get_session_id():
+    # Kept in the URL so that a reload continues the same question history
+    if 'sid' not in st.query_params:
+        st.query_params['sid'] = uuid.uuid4().hex
+    return st.query_params['sid']
+
+def handle_quiz_generation(kind, num_questions, quiz_type, quiz_level, language, **inputs):
+    # kind: "document" (inputs: data, an uploads.Document), "catalog" (subject, sub_field) or "topic" (topic)
+    use_cache = not st.session_state.get('fresh_questions', False)
+    render_seconds = [0.0]
+    preview = st.empty()
+    preview_box = preview.container()
+    previewed = []
+
+    def accept_question(q):
+        # Read-only preview while the rest of the quiz is generated; the interactive
+        # quiz is drawn by display_quiz_questions once generation has finished
+        previewed.append(q)
+        render_start = time.perf_counter()
+        with preview_box:
+            display_question_preview(len(previewed), q)
+        render_seconds[0] += time.perf_counter() - render_start
+
+    parameters = dict(num_questions=num_questions, quiz_type=quiz_type, quiz_level=quiz_level, language=language,
+                      use_cache=use_cache, on_question=accept_question)
     try:
-        all_questions = json.loads(response)
-        unique_questions = [q for q in all_questions if q not in st.session_state.history]
-        
-        if len(unique_questions) < len(st.session_state.user_answers):
-            st.warning(f"Only {len(unique_questions)} unique questions were generated.")
-        st.session_state.questions = unique_questions
-        st.session_state.history.extend(unique_questions)
-        st.session_state.user_answers = {f"q{i+1}": None for i in range(len(st.session_state.questions))}
+        if api_client.API_URL:
+            questions = api_client.generate_quiz(kind, get_session_id(), inputs, **parameters)
+        elif kind == 'document':
+            questions = quiz_service.document_quiz(st.session_state.history, quiz_service.document_text(inputs['data']),
+                                                   quiz_service.document_key(inputs['data']), **parameters)
+        elif kind == 'catalog':
+            questions = quiz_service.catalog_quiz(st.session_state.history, inputs['subject'], inputs['sub_field'], **parameters)
+        else:
+            questions = quiz_service.topic_quiz(st.session_state.history, inputs['topic'], **parameters)
     except json.JSONDecodeError:
         st.error("Failed to parse the quiz questions. Please try again.")
-
+        return
+    except rate_limit.RETRYABLE_ERRORS:
+        st.error("The model is busy right now. Please try again in a minute.")
+        return
+    except api_client.ApiError as e:
+        st.error(str(e))
+        return
+
+    telemetry.observe("render", render_seconds[0])
+    preview.empty()
+    if len(questions) < num_questions:
+        st.warning(f"Only {len(questions)} unique questions were generated.")
+    # Compact per-session state: shared immutable questions, and answers and timings as
+    # small arrays indexed by question
+    st.session_state.questions = quiz_items.from_dicts(questions)
+    st.session_state.answers = quiz_items.new_answers(len(questions))
+    st.session_state.quiz_page = 0
+    st.session_state.quiz_runs = 0
+    st.session_state.quiz_cpu = 0.0
+    st.session_state.page_shown = time.time()
+    st.session_state.answer_seconds = quiz_items.new_latencies(len(questions))
+
+def display_question_preview(number, q):
+    st.write(f"**Q{number}: {q['question']}**")
+    for option in q.get('options') or ['True', 'False']:
+        st.write(f"- {option}")
+    st.write("---")
+
+def measure_run(kind, cpu_start):
+    # Script and fragment runs and their server CPU time, in total and for the current quiz
+    cpu = time.thread_time() - cpu_start
+    telemetry.count(f"{kind}_runs")
+    telemetry.observe(f"{kind}_cpu", cpu)
+    if st.session_state.get('questions'):
+        st.session_state.quiz_runs = st.session_state.get('quiz_runs', 0) + 1
+        st.session_state.quiz_cpu = st.session_state.get('quiz_cpu', 0.0) + cpu
+
+def record_page_answers(first, last, page_change=0):
+    # Form callback: a page's answers reach the server only when the form is submitted.
+    # Time spent on the page is shared out evenly between its questions for the attempt log.
+    now = time.time()
+    spent = (now - st.session_state.get('page_shown', now)) / max(last - first, 1)
+    st.session_state.page_shown = now
+    for i in range(first, last):
+        st.session_state.answers[i] = st.session_state.get(f"q{i+1}", -1)
+        st.session_state.answer_seconds[i] += spent
+    st.session_state.quiz_page = st.session_state.get('quiz_page', 0) + page_change
+
+@st.fragment
 def display_quiz_questions():
+    # Selecting answers happens inside a form, and page changes or submitting only rerun
+    # this fragment, never the sidebar and document handling in main()
+    cpu_start = time.thread_time()
     if st.session_state.questions:
+        questions = st.session_state.questions
+        page_size = QUIZ_PAGE_SIZE or len(questions)
+        pages = -(-len(questions) // page_size)
+        page = min(st.session_state.get('quiz_page', 0), pages - 1)
+        first, last = page * page_size, min(len(questions), (page + 1) * page_size)
         st.subheader("Quiz Questions")
-        for i, q in enumerate(st.session_state.questions):
-            st.write(f"**Q{i+1}: {q['question']}**")
-            if 'options' in q:
-                selected_option = st.radio(f"Select an answer for Q{i+1}:", options=q['options'], key=f"q{i+1}")
-            else:
-                selected_option = st.radio(f"Select True or False for Q{i+1}:", options=['True', 'False'], key=f"q{i+1}")
-            st.session_state.user_answers[f"q{i+1}"] = selected_option
-            st.write("---")
+        if pages > 1:
+            st.caption(f"Page {page + 1} of {pages}")
+        with st.form(f"quiz_page_{page}"):
+            for i in range(first, last):
+                q = questions[i]
+                st.write(f"**Q{i+1}: {q.question}**")
+                label = f"Select an answer for Q{i+1}:" if q.options else f"Select True or False for Q{i+1}:"
+                # The widget's value is the option index. Pages are drawn afresh, so start
+                # from the answer recorded for this question.
+                st.radio(label, options=range(len(q.choices)), format_func=q.choices.__getitem__, key=f"q{i+1}",
+                         index=max(st.session_state.answers[i], 0))
+                st.write("---")
 
+            previous_column, next_column, submit_column = st.columns(3)
+            if page > 0:
+                previous_column.form_submit_button('Previous page', on_click=record_page_answers, args=(first, last, -1))
+            if page < pages - 1:
+                next_column.form_submit_button('Next page', on_click=record_page_answers, args=(first, last, 1))
+                submitted = False
+            else:
+                submitted = submit_column.form_submit_button('Submit Answers', on_click=record_page_answers, args=(first, last))
 
-        if st.button('Submit Answers'):
+        if submitted:
             st.subheader("Quiz Results")
-            score = 0
-            for i, q in enumerate(st.session_state.questions):
-                correct_answer = q['answer']
-                user_answer = st.session_state.user_answers[f"q{i+1}"]
-
+            answers, latencies = st.session_state.answers, st.session_state.answer_seconds
+            user_answers = quiz_items.answer_map(questions, answers)
+            try:
+                if api_client.API_URL:
+                    # The API service records the attempt in its own log
+                    results, score = api_client.grade_answers(questions, user_answers, get_session_id(),
+                                                              quiz_items.latency_map(latencies))
+                else:
+                    results, score = grading.grade_answers(questions, user_answers)
+                    attempt_log.log.record_chosen(get_session_id(), questions, answers, latencies)
+            except api_client.ApiError as e:
+                st.error(str(e))
+                return
+            for i, result in enumerate(results):
                 # Display the user's selected answer
-                st.write(f"**Q{i+1}: {q['question']}**")
-                st.write(f"Your answer: **{user_answer}**")
-                st.write(f"Correct answer: **{correct_answer}**")
+                st.write(f"**Q{i+1}: {result['question']}**")
+                st.write(f"Your answer: **{result['user_answer']}**")
+                st.write(f"Correct answer: **{result['correct_answer']}**")
                 
                 # Show if the answer was correct or not
-                if user_answer == correct_answer:
-                    score += 1
+                if result['correct']:
                     st.success("Correct!")
                 else:
                     st.error("Incorrect.")
                 
                 # Display the explanation
-                st.write(f"Explanation: {q['explanation']}")
+                st.write(f"Explanation: {result['explanation']}")
                 st.write("---")
             score_message = f"Your score is {score}/{len(st.session_state.questions)}!"
             st.markdown(
@@ -111,9 +265,15 @@ def display_quiz_questions():
                 </div>
                 """, unsafe_allow_html=True
             )
+            logger.info("Quiz of %d questions answered with %d script and fragment runs, %.3fs server CPU",
+                        len(st.session_state.questions), st.session_state.get('quiz_runs', 0), st.session_state.get('quiz_cpu', 0.0))
             #score_message = f"Your score is {score}/{len(st.session_state.questions)}!"
             #st.markdown(f"<p style='color:blue; font-size:24px; font-weight:bold; font-family:Arial;'>{score_message}</p>", unsafe_allow_html=True)
             # st.success(f"Your score is {score}/{len(st.session_state.questions)}!")
+
+    # A full script run already counts the time spent here
+    if not st.session_state.get('in_script_run'):
+        measure_run("fragment", cpu_start)
     
 
         # if st.button('Submit Answers'):
@@ -135,6 +295,8 @@ def display_quiz_questions():
 
 def main():
     st.set_page_config(page_title="Quiz App", page_icon='🤖', layout='centered', initial_sidebar_state='collapsed')
+    cpu_start = time.thread_time()
+    st.session_state.in_script_run = True
     
     # Apply custom styles to the whole page and title
     st.markdown(
@@ -214,11 +376,18 @@ def main():
 
     # Initialize session state
     if 'questions' not in st.session_state:
-        st.session_state.questions = []
-    if 'user_answers' not in st.session_state:
-        st.session_state.user_answers = {}
-    if 'history' not in st.session_state:
-        st.session_state.history = []
+        st.session_state.questions = ()
+    if 'answers' not in st.session_state:
+        st.session_state.answers = quiz_items.new_answers(0)
+    # As a client of the quiz API, history and the question bank live in the API process
+    if not api_client.API_URL:
+        if 'history' not in st.session_state:
+            st.session_state.history = quiz_service.get_history(get_session_id())
+
+        # Starts the question bank warmer once per process
+        quiz_service.start_warmer()
+    # Starts the metrics endpoint once per process
+    telemetry.start_exporter()
 
     # Sidebar for initial choice
     st.sidebar.title('Please select an option')
@@ -226,73 +395,22 @@ def main():
         'Please choose how you would like to proceed:',
         ('Select.....', 'Upload PDF/Text File', 'Data Science', 'Enter the Topic')
     )
+    # Every span and counter recorded during this run is labelled with the input mode
+    telemetry.set_mode(initial_choice)
 
+    uploaded_file = None
     if initial_choice == 'Upload PDF/Text File':
         uploaded_file = st.sidebar.file_uploader("Upload a PDF to create a quiz from its content.", type=["pdf"])
 
-        if uploaded_file:
-            pdf_text = get_pdf_text(uploaded_file)
+        document = get_document(uploaded_file) if uploaded_file else None
+        if document and not api_client.API_URL and not read_document(uploaded_file, document):
+            document = None
+        if document:
             num_questions, quiz_type, quiz_level, language = get_quiz_parameters()
 
             if st.sidebar.button('Generate Quiz'):
                 if quiz_type != 'Select.....' and quiz_level != 'Select.....' and language != 'Select.....':
-                    prompt = f"""
-                    Using the following JSON schema, generate unique quiz questions based on the selected parameters:
-                    - **Number of Questions**: {num_questions}
-                    - **Type of Quiz**: {quiz_type}
-                    - **Difficulty Level**: {quiz_level}
-                    - **Language**: {language} 
-                    Ensure that none of the questions have been previously asked (refer to the provided history of questions).
-                    The questions should be well-structured and cover a range of topics within the following content:
-                    
-                    {pdf_text}
-
-                    Depending on the selected quiz type, structure the questions as follows:
-
-                    1. **For Multiple Choice:**
-                    - Each question should have four possible answer options.
-                    - Include one correct answer.
-                    - Provide an explanation for the correct answer.
-
-                    2. **For True/False:**
-                    - Each question should be a true/false statement.
-                    - Indicate the correct answer (either "True" or "False").
-                    - Provide an explanation for the correct answer.
-
-                    Please provide the questions in the following JSON format:
-
-                    **For Multiple Choice:**
-                    [
-                        {{
-                            "question": "string",         # The quiz question text
-                            "options": [                  # A list of four possible answer options
-                                "option1",
-                                "option2",
-                                "option3",
-                                "option4"
-                            ],
-                            "answer": "string",           # The correct answer option
-                            "explanation": "string"       # A brief explanation for why the answer is correct
-                        }},
-                        ...
-                    ]
-
-                    **For True/False:**
-                    [
-                        {{
-                            "question": "string",         # The true/false statement
-                            "answer": "True/False",       # The correct answer (True or False)
-                            "explanation": "string"       # A brief explanation for why the answer is correct
-                        }},
-                        ...
-                    ]
-
-                    Notes:
-                    Ensure that all questions are unique and have not been asked before (refer to the history provided).
-                    The explanations should be clear and concise, providing context or additional information about the correct answer.
-                    Review and format the JSON response to ensure it matches the provided schema.
-                    """
-                    handle_quiz_generation(prompt)
+                    handle_quiz_generation('document', num_questions, quiz_type, quiz_level, language, data=document)
                 else:
                     st.error("Please select quiz parameters including type, level and language.")
 
@@ -303,62 +421,7 @@ def main():
 
         if st.sidebar.button('Generate Quiz'):
             if main_option != 'Select.....' and sub_option != 'Select.....' and quiz_type != 'Select.....' and quiz_level != 'Select.....' and language != 'Select.....':
-                prompt = f"""
-                Using the following JSON schema, generate unique quiz questions based on the selected parameters:
-                - **Subject**: {main_option}
-                - **Sub-field**: {sub_option}
-                - **Number of Questions**: {num_questions}
-                - **Type of Quiz**: {quiz_type}
-                - **Difficulty Level**: {quiz_level}
-                - **Language**: {language} 
-                Ensure that none of the questions have been previously asked (refer to the provided history of questions).
-                The questions should be well-structured and cover a range of topics within {sub_option}.
-                Depending on the selected quiz type, structure the questions as follows:
-
-                1. **For Multiple Choice:**
-                - Each question should have four possible answer options.
-                - Include one correct answer.
-                - Provide an explanation for the correct answer.
-
-                2. **For True/False:**
-                - Each question should be a true/false statement.
-                - Indicate the correct answer (either "True" or "False").
-                - Provide an explanation for the correct answer.
-
-                Please provide the questions in the following JSON format:
-
-                **For Multiple Choice:**
-                [
-                    {{
-                        "question": "string",         # The quiz question text
-                        "options": [                  # A list of four possible answer options
-                            "option1",
-                            "option2",
-                            "option3",
-                            "option4"
-                        ],
-                        "answer": "string",           # The correct answer option
-                        "explanation": "string"       # A brief explanation for why the answer is correct
-                    }},
-                    ...
-                ]
-
-                **For True/False:**
-                [
-                    {{
-                        "question": "string",         # The true/false statement
-                        "answer": "True/False",       # The correct answer (True or False)
-                        "explanation": "string"       # A brief explanation for why the answer is correct
-                    }},
-                    ...
-                ]
-
-                Notes:
-                Ensure that all questions are unique and have not been asked before (refer to the history provided).
-                The explanations should be clear and concise, providing context or additional information about the correct answer.
-                Review and format the JSON response to ensure it matches the provided schema.
-                """
-                handle_quiz_generation(prompt)
+                handle_quiz_generation('catalog', num_questions, quiz_type, quiz_level, language, subject=main_option, sub_field=sub_option)
             else:
                 st.error("Please select a valid subject, sub-field and quiz parameters including type, level and language.")
 
@@ -368,64 +431,18 @@ def main():
 
         if st.sidebar.button('Generate Quiz'):
             if topic.strip() and quiz_type != 'Select.....' and quiz_level != 'Select.....' and language != 'Select.....':
-                prompt = f"""
-                Using the following JSON schema, generate unique quiz questions based on the selected parameters:
-                - **Number of Questions**: {num_questions}
-                - **Type of Quiz**: {quiz_type}
-                - **Difficulty Level**: {quiz_level}
-                - **Language**: {language} 
-                Ensure that none of the questions have been previously asked (refer to the provided history of questions).
-                The questions should be well-structured and cover a range of topics within {topic}.
-                Depending on the selected quiz type, structure the questions as follows:
-
-                1. **For Multiple Choice:**
-                - Each question should have four possible answer options.
-                - Include one correct answer.
-                - Provide an explanation for the correct answer.
-
-                2. **For True/False:**
-                - Each question should be a true/false statement.
-                - Indicate the correct answer (either "True" or "False").
-                - Provide an explanation for the correct answer.
-
-                Please provide the questions in the following JSON format:
-
-                **For Multiple Choice:**
-                [
-                    {{
-                        "question": "string",         # The quiz question text
-                        "options": [                  # A list of four possible answer options
-                            "option1",
-                            "option2",
-                            "option3",
-                            "option4"
-                        ],
-                        "answer": "string",           # The correct answer option
-                        "explanation": "string"       # A brief explanation for why the answer is correct
-                    }},
-                    ...
-                ]
-
-                **For True/False:**
-                [
-                    {{
-                        "question": "string",         # The true/false statement
-                        "answer": "True/False",       # The correct answer (True or False)
-                        "explanation": "string"       # A brief explanation for why the answer is correct
-                    }},
-                    ...
-                ]
-
-                Notes:
-                Ensure that all questions are unique and have not been asked before (refer to the history provided).
-                The explanations should be clear and concise, providing context or additional information about the correct answer.
-                Review and format the JSON response to ensure it matches the provided schema.
-                """
-                handle_quiz_generation(prompt)
+                handle_quiz_generation('topic', num_questions, quiz_type, quiz_level, language, topic=topic)
             else:
                 st.error("Please enter a topic and select quiz parameters.")
 
     display_quiz_questions()
+    # What this session holds in the app process; its history index is tracked by quiz_service
+    session_id = get_session_id()
+    session_memory.manager.account(session_id, "quiz", session_memory.deep_size(
+        (st.session_state.questions, st.session_state.answers, st.session_state.get('answer_seconds'))))
+    session_memory.manager.account(session_id, "upload", uploaded_file.size if uploaded_file else 0)
+    st.session_state.in_script_run = False
+    measure_run("script", cpu_start)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,231 @@
+import argparse
+import atexit
+import glob
+import os
+import threading
+import time
+import uuid
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import dedup
+
+
+# Every graded answer, appended to a columnar log of Parquet files: one row per question
+# per attempt with the question fingerprint, chosen and correct option (as indexes into
+# the question's options, -1 when unanswered), correctness and response time. Grading and
+# item statistics run as NumPy batch operations over whole columns, so re-grading a
+# cohort or analysing millions of answers stays a matter of seconds on one core.
+LOG_DIR = os.getenv("ATTEMPT_LOG_DIR", os.path.join(os.path.expanduser("~"), ".cache", "ai-quiz", "attempts"))
+# Buffered rows are written once there are this many, or this many seconds after the oldest
+FLUSH_ROWS = int(os.getenv("ATTEMPT_LOG_FLUSH_ROWS", "5000"))
+FLUSH_SECONDS = float(os.getenv("ATTEMPT_LOG_FLUSH_SECONDS", "60"))
+# Small part files are merged into one once there are this many
+COMPACT_FILES = int(os.getenv("ATTEMPT_LOG_COMPACT_FILES", "64"))
+MAX_OPTIONS = 8
+
+SCHEMA = pa.schema([
+    ("attempt", pa.int64()),
+    ("session_id", pa.dictionary(pa.int32(), pa.string())),
+    ("fingerprint", pa.dictionary(pa.int32(), pa.string())),
+    ("chosen", pa.int8()),
+    ("answer", pa.int8()),
+    ("options", pa.int8()),
+    ("correct", pa.bool_()),
+    ("latency", pa.float32()),
+    ("timestamp", pa.float64()),
+])
+
+
+def grade(chosen, answer):
+    # Vectorized grading: one comparison over whole columns; unanswered (-1) is never correct
+    return (chosen == answer) & (chosen >= 0)
+
+
+def attempt_scores(attempt, correct):
+    # Score and length of every attempt, in the order of np.unique(attempt)
+    attempts, codes = np.unique(attempt, return_inverse=True)
+    return attempts, np.bincount(codes, weights=correct), np.bincount(codes)
+
+
+def item_statistics(item, attempt, chosen, answer, latency=None, max_options=MAX_OPTIONS):
+    # item: integer code per row (e.g. fingerprint dictionary indices). Per item:
+    #   responses       - answers recorded
+    #   difficulty      - proportion answered correctly (the classical p-value)
+    #   discrimination  - point-biserial correlation between answering the item correctly and
+    #                     the rest of the attempt's score (share correct of the other questions)
+    #   option_rates    - share of responses choosing each option index; for the indexes other
+    #                     than answer_option these are the distractor selection rates
+    #   unanswered_rate - share of responses with no option chosen
+    #   mean_latency    - mean response time in seconds
+    item = np.asarray(item, dtype=np.int64)
+    chosen = np.asarray(chosen, dtype=np.int64)
+    correct = grade(chosen, np.asarray(answer)).astype(np.float64)
+    n_items = int(item.max()) + 1 if len(item) else 0
+    n = np.bincount(item, minlength=n_items).astype(np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        right = np.bincount(item, weights=correct, minlength=n_items)
+        difficulty = right / n
+
+        _, codes = np.unique(attempt, return_inverse=True)
+        totals = np.bincount(codes, weights=correct)
+        lengths = np.bincount(codes)
+        rest = (totals[codes] - correct) / np.maximum(lengths[codes] - 1, 1)
+        sum_y = np.bincount(item, weights=rest, minlength=n_items)
+        sum_xy = np.bincount(item, weights=correct * rest, minlength=n_items)
+        sum_yy = np.bincount(item, weights=rest * rest, minlength=n_items)
+        covariance = n * sum_xy - right * sum_y
+        spread = (n * right - right * right) * (n * sum_yy - sum_y * sum_y)
+        discrimination = np.where(spread > 0, covariance / np.sqrt(np.where(spread > 0, spread, 1)), np.nan)
+
+        answered = chosen >= 0
+        option_counts = np.bincount(item[answered] * max_options + chosen[answered],
+                                    minlength=n_items * max_options).reshape(n_items, max_options)
+        option_rates = option_counts / n[:, None]
+        unanswered_rate = 1 - option_counts.sum(axis=1) / n
+
+        answer_option = np.full(n_items, -1, dtype=np.int8)
+        answer_option[item] = answer
+        stats = {"responses": n.astype(np.int64), "difficulty": difficulty, "discrimination": discrimination,
+                 "option_rates": option_rates, "answer_option": answer_option, "unanswered_rate": unanswered_rate}
+        if latency is not None:
+            latency = np.asarray(latency, dtype=np.float64)
+            timed = ~np.isnan(latency)
+            stats["mean_latency"] = (np.bincount(item[timed], weights=latency[timed], minlength=n_items)
+                                     / np.bincount(item[timed], minlength=n_items))
+    return stats
+
+
+class AttemptLog:
+    def __init__(self, path=LOG_DIR, flush_rows=FLUSH_ROWS, flush_seconds=FLUSH_SECONDS, compact_files=COMPACT_FILES):
+        self.path = path
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.compact_files = compact_files
+        self._lock = threading.Lock()
+        self._rows = {name: [] for name in SCHEMA.names}
+        self._oldest = None
+        os.makedirs(path, exist_ok=True)
+
+    def record(self, session_id, questions, user_answers, latencies=None):
+        # questions and user_answers as in grading.grade_answers; latencies maps "q1", ...
+        # to seconds spent on the question
+        chosen, seconds = [], []
+        for i, q in enumerate(questions):
+            options = q.get('options') or ['True', 'False']
+            user_answer = user_answers.get(f"q{i+1}")
+            chosen.append(options.index(user_answer) if user_answer in options else -1)
+            seconds.append((latencies or {}).get(f"q{i+1}", float("nan")))
+        self.record_chosen(session_id, questions, chosen, seconds)
+
+    def record_chosen(self, session_id, questions, chosen, latencies=None):
+        # chosen: option index per question (-1 when unanswered); latencies: seconds per question
+        attempt = time.time_ns()
+        now = time.time()
+        with self._lock:
+            rows = self._rows
+            for i, q in enumerate(questions):
+                options = q.get('options') or ['True', 'False']
+                answer = options.index(q['answer']) if q['answer'] in options else -1
+                rows["attempt"].append(attempt)
+                rows["session_id"].append(session_id)
+                # quiz_items.Question carries its fingerprint
+                rows["fingerprint"].append(getattr(q, "fingerprint", None) or dedup.fingerprint(q))
+                rows["chosen"].append(chosen[i])
+                rows["answer"].append(answer)
+                rows["options"].append(len(options))
+                rows["correct"].append(chosen[i] >= 0 and chosen[i] == answer)
+                rows["latency"].append(latencies[i] if latencies is not None else float("nan"))
+                rows["timestamp"].append(now)
+            if self._oldest is None:
+                self._oldest = now
+            due = len(rows["attempt"]) >= self.flush_rows or now - self._oldest >= self.flush_seconds
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            if not self._rows["attempt"]:
+                return
+            table = pa.Table.from_pydict(self._rows, schema=SCHEMA)
+            self._rows = {name: [] for name in SCHEMA.names}
+            self._oldest = None
+        self._write(table, "part")
+        if len(self._files()) >= self.compact_files:
+            self.compact()
+
+    def _write(self, table, prefix):
+        # Written under a temporary name and renamed, so readers never see a partial file
+        name = os.path.join(self.path, f"{prefix}-{time.time_ns()}-{uuid.uuid4().hex[:8]}.parquet")
+        pq.write_table(table, name + ".tmp")
+        os.replace(name + ".tmp", name)
+
+    def _files(self):
+        return sorted(glob.glob(os.path.join(self.path, "*.parquet")))
+
+    def compact(self):
+        # Merges every part file into one; skipped while another process is compacting
+        lock = os.path.join(self.path, "compact.lock")
+        try:
+            fd = os.open(lock, os.O_CREAT | os.O_EXCL)
+        except FileExistsError:
+            if time.time() - os.path.getmtime(lock) < 600:
+                return
+            os.remove(lock)
+            return self.compact()
+        try:
+            files = self._files()
+            if len(files) > 1:
+                self._write(pa.concat_tables([pq.read_table(f, schema=SCHEMA) for f in files]).combine_chunks(), "compact")
+                for f in files:
+                    os.remove(f)
+        finally:
+            os.close(fd)
+            os.remove(lock)
+
+    def read(self):
+        self.flush()
+        files = self._files()
+        if not files:
+            return SCHEMA.empty_table()
+        return pa.concat_tables([pq.read_table(f, schema=SCHEMA) for f in files]).unify_dictionaries().combine_chunks()
+
+    def statistics(self):
+        # item_statistics over the whole log, keyed by fingerprint
+        table = self.read()
+        fingerprints = table.column("fingerprint").combine_chunks()
+        if not len(fingerprints):
+            return [], item_statistics([], [], [], [])
+        stats = item_statistics(fingerprints.indices.to_numpy(zero_copy_only=False), table.column("attempt").to_numpy(),
+                                table.column("chosen").to_numpy(), table.column("answer").to_numpy(),
+                                table.column("latency").to_numpy(zero_copy_only=False))
+        return fingerprints.dictionary.to_pylist(), stats
+
+
+log = AttemptLog()
+atexit.register(log.flush)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Item statistics over every graded answer.")
+    parser.add_argument("--sort", choices=("difficulty", "discrimination", "responses"), default="discrimination")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--min-responses", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    fingerprints, stats = log.statistics()
+    keep = np.flatnonzero(stats["responses"] >= args.min_responses)
+    order = keep[np.argsort(np.nan_to_num(stats[args.sort][keep], nan=np.inf))][:args.top]
+    print(f"{int(stats['responses'].sum())} answers to {len(fingerprints)} questions")
+    print(f"{'question':<14}{'responses':>10}{'difficulty':>11}{'discrim.':>10}  options chosen (answer marked *)")
+    for i in order:
+        rates = " ".join(f"{'ABCDEFGH'[option]}{'*' if option == stats['answer_option'][i] else ''}={rate:.2f}"
+                         for option, rate in enumerate(stats["option_rates"][i]) if rate > 0 or option == stats["answer_option"][i])
+        print(f"{fingerprints[i][:12]:<14}{stats['responses'][i]:>10}{stats['difficulty'][i]:>11.2f}"
+              f"{stats['discrimination'][i]:>10.2f}  {rates}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+import abc
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+
+from google.api_core import exceptions as api_exceptions
+
+import model_registry
+import prompts
+import retrieval
+
+
+# Model backends take a prompt and a generation config and return text, either in one
+# piece (generate) or as a stream of chunks (stream). QUIZ_BACKEND selects one:
+#   gemini - the Google Generative AI API (default)
+#   fake   - an in-process stand-in returning schema-valid quiz JSON (or plain-text summaries)
+#            with configurable latency, jitter, truncation and error rates, for offline load
+#            tests and benchmarks
+BACKEND = os.getenv("QUIZ_BACKEND", "gemini")
+
+logger = logging.getLogger(__name__)
+
+
+class Backend(abc.ABC):
+    @abc.abstractmethod
+    def generate(self, prompt, config=None):
+        pass
+
+    def stream(self, prompt, config=None):
+        # Backends without native streaming deliver the whole response as one chunk
+        yield self.generate(prompt, config)
+
+
+class GeminiBackend(Backend):
+    def _request(self, prompt, config):
+        # Large document prefixes are registered once with the provider's context cache,
+        # after which only the per-request suffix is sent; anything else goes out whole
+        if isinstance(prompt, prompts.Prompt):
+            model = model_registry.registry.get_for_prefix(
+                prompt.prefix_key, prompt.prefix, retrieval.estimate_tokens(prompt.prefix), config)
+            if model is not None:
+                return model, prompt.suffix
+        # The registry hands out a shared, already-built model for this name and config
+        return model_registry.registry.get(model_registry.MODEL_NAME, config), str(prompt)
+
+    @staticmethod
+    def _log_usage(response):
+        usage = getattr(response, "usage_metadata", None)
+        if usage:
+            logger.info("Model usage: %d prompt tokens (%d from context cache), %d output tokens",
+                        usage.prompt_token_count, getattr(usage, "cached_content_token_count", 0),
+                        usage.candidates_token_count)
+
+    def generate(self, prompt, config=None):
+        model, contents = self._request(prompt, config)
+        response = model.generate_content(contents)
+        self._log_usage(response)
+        return response.text
+
+    def stream(self, prompt, config=None):
+        model, contents = self._request(prompt, config)
+        response = model.generate_content(contents, stream=True)
+        for chunk in response:
+            yield chunk.text
+        self._log_usage(response)
+
+
+_WORDS = """
+model data training feature label gradient loss weight bias layer neuron network kernel
+matrix vector tensor sample batch epoch variance mean median mode probability estimate
+hypothesis regression classification cluster distance margin entropy information prior
+posterior likelihood sigmoid softmax activation dropout pooling filter sequence memory
+attention embedding token optimizer momentum learning rate validation test accuracy
+precision recall threshold curve derivative integral limit eigenvalue determinant rank
+projection basis span norm distribution sampling bootstrap interval significance error
+""".split()
+
+
+class FakeBackend(Backend):
+    def __init__(self, latency=None, jitter=None, truncation_rate=None, error_rate=None, seed=None, chunk_chars=None):
+        env = os.getenv
+        self.latency = float(env("FAKE_BACKEND_LATENCY", "1.0")) if latency is None else latency
+        self.jitter = float(env("FAKE_BACKEND_JITTER", "0.2")) if jitter is None else jitter
+        self.truncation_rate = float(env("FAKE_BACKEND_TRUNCATION_RATE", "0.0")) if truncation_rate is None else truncation_rate
+        self.error_rate = float(env("FAKE_BACKEND_ERROR_RATE", "0.0")) if error_rate is None else error_rate
+        self.seed = int(env("FAKE_BACKEND_SEED", "0")) if seed is None else seed
+        self.chunk_chars = int(env("FAKE_BACKEND_CHUNK_CHARS", "200")) if chunk_chars is None else chunk_chars
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def _rng(self, prompt):
+        # Deterministic per (seed, prompt, n-th call with that prompt): runs are reproducible,
+        # while asking the same thing twice still returns different questions
+        digest = hashlib.sha256(str(prompt).encode("utf-8")).hexdigest()
+        with self._lock:
+            call = self._calls.get(digest, 0)
+            self._calls[digest] = call + 1
+        return random.Random(f"{self.seed}:{digest}:{call}")
+
+    @staticmethod
+    def _parameter(prompt, name, default):
+        match = re.search(rf"\*\*{re.escape(name)}\*\*:\s*([^\n]+)", str(prompt))
+        return match.group(1).strip() if match else default
+
+    def _questions(self, prompt, rng):
+        count = int(self._parameter(prompt, "Number of Questions", "5"))
+        true_false = self._parameter(prompt, "Type of Quiz", "Multiple-Choice") == "True-False"
+        questions = []
+        for _ in range(count):
+            stem = " ".join(rng.sample(_WORDS, 8))
+            if true_false:
+                answer = rng.choice(["True", "False"])
+                questions.append({"question": f"The {stem} statement holds.", "answer": answer,
+                                  "explanation": f"It is {answer.lower()} because of the {rng.choice(_WORDS)}."})
+            else:
+                options = [" ".join(rng.sample(_WORDS, 3)) for _ in range(4)]
+                questions.append({"question": f"Which {stem}?", "options": options, "answer": rng.choice(options),
+                                  "explanation": f"The {rng.choice(_WORDS)} determines the answer."})
+        return questions
+
+    def _summary(self, prompt):
+        # Plain-text requests are document summaries: words sampled evenly from the prompt
+        words = str(prompt).split()
+        length = int(self._parameter(prompt, "Summary Length", "150").split()[0])
+        return " ".join(words[::max(1, len(words) // length)][:length])
+
+    def _respond(self, prompt, config=None):
+        rng = self._rng(prompt)
+        delay = max(0.0, rng.gauss(self.latency, self.jitter))
+        if rng.random() < self.error_rate:
+            time.sleep(delay / 4)
+            raise rng.choice([api_exceptions.ResourceExhausted, api_exceptions.ServiceUnavailable])("Fake backend error")
+        if (config or {}).get("response_mime_type") == "text/plain":
+            return self._summary(prompt), delay
+        text = json.dumps(self._questions(prompt, rng), ensure_ascii=False)
+        if rng.random() < self.truncation_rate:
+            text = text[:rng.randint(1, len(text) - 1)]
+        return text, delay
+
+    def generate(self, prompt, config=None):
+        text, delay = self._respond(prompt, config)
+        time.sleep(delay)
+        return text
+
+    def stream(self, prompt, config=None):
+        text, delay = self._respond(prompt, config)
+        chunks = [text[i:i + self.chunk_chars] for i in range(0, len(text), self.chunk_chars)]
+        for chunk in chunks:
+            time.sleep(delay / len(chunks))
+            yield chunk
+
+
+def create_backend(name=BACKEND):
+    if name == "fake":
+        return FakeBackend()
+    if name == "gemini":
+        return GeminiBackend()
+    raise ValueError(f"Unknown QUIZ_BACKEND {name!r}; expected 'gemini' or 'fake'")
+
+
+backend = create_backend()
@@ -0,0 +1,218 @@
+import argparse
+import csv
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import pdf_cache
+import pdf_extract
+import quiz_service
+import uploads
+
+
+# Bulk quiz generation from a manifest, outside Streamlit:
+#   python batch_cli.py manifest.jsonl -o quizzes.jsonl
+# Each manifest entry (a JSON object per line, or a CSV row) names one source, "pdf"
+# (path, relative to the manifest), "topic", or "subject" + "sub_field", plus optional
+# "id", "num_questions", "quiz_type", "quiz_level" and "language" (defaults come from the
+# command line). Every finished entry is appended to the output as one JSON line and
+# fsynced, so the output doubles as the checkpoint: running the same command again skips
+# entries that already succeeded and retries the rest.
+PDF_WORKERS = int(os.getenv("BATCH_PDF_WORKERS", str(os.cpu_count() or 1)))
+# Quizzes generated at once; each fans out into up to QUIZ_MAX_CONCURRENCY model calls
+CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+
+logger = logging.getLogger(__name__)
+
+
+def read_manifest(path):
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".csv"):
+            rows = ({k: v for k, v in row.items() if v not in (None, "")} for row in csv.DictReader(f))
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for row in rows:
+            row["_id"] = item_id(row)
+            if row.get("pdf"):
+                row["pdf"] = os.path.join(base, row["pdf"])
+            yield row
+
+
+def item_id(item):
+    # Entries without an explicit id are identified by their content, so reordering or
+    # appending to the manifest does not invalidate the checkpoint
+    if item.get("id"):
+        return str(item["id"])
+    return hashlib.sha1(json.dumps(item, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def completed_ids(output):
+    # Ids whose latest record in the output succeeded; a line cut off by a crash is ignored
+    done = set()
+    if not os.path.exists(output):
+        return done
+    with open(output, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("status") == "ok":
+                done.add(record["id"])
+            else:
+                done.discard(record.get("id"))
+    return done
+
+
+def extract_pdf(path):
+    # Runs in the PDF process pool; the text cache is shared with the app through the disk.
+    # The file is hashed in chunks and parsed straight from disk, never read into memory whole.
+    document = uploads.Document.from_path(path)
+    uploads.check_pages(document)
+    key = document.key
+    cache_key = f"{key}-max{quiz_service.PDF_MAX_PAGES}" if quiz_service.PDF_MAX_PAGES else key
+    text = pdf_cache.cache.get(cache_key)
+    if text is None:
+        text = pdf_extract.extract_text(path, max_pages=quiz_service.PDF_MAX_PAGES or None, workers=1)
+        pdf_cache.cache.put(cache_key, text)
+    return key, text
+
+
+def generate(item, parameters, document, use_cache):
+    # Each entry gets its own history, so a retried entry does not repeat its earlier questions
+    history = quiz_service.get_history(f"batch:{item['_id']}")
+    if document:
+        key, text = document
+        return quiz_service.document_quiz(history, text, key, use_cache=use_cache, **parameters)
+    if item.get("topic"):
+        return quiz_service.topic_quiz(history, item["topic"], use_cache=use_cache, **parameters)
+    return quiz_service.catalog_quiz(history, item["subject"], item["sub_field"], use_cache=use_cache, **parameters)
+
+
+def validate(item, defaults):
+    parameters = quiz_service.quiz_parameters(dict(defaults, **item))
+    sources = [name for name in ("pdf", "topic", "subject") if item.get(name)]
+    if len(sources) != 1:
+        raise ValueError("each entry needs exactly one of pdf, topic or subject")
+    if item.get("subject") and item.get("sub_field") not in quiz_service.SUB_OPTIONS.get(item["subject"], [])[1:]:
+        raise ValueError(f"unknown subject/sub_field {item.get('subject')!r}/{item.get('sub_field')!r}")
+    return parameters
+
+
+def run(manifest, output, defaults, concurrency=CONCURRENCY, pdf_workers=PDF_WORKERS, use_cache=True):
+    done = completed_ids(output)
+    stats = {"ok": 0, "failed": 0, "skipped": 0}
+    start = time.perf_counter()
+    out = open(output, "a", encoding="utf-8")
+
+    def write(item, started, questions=None, error=None):
+        record = {"id": item["_id"], "status": "error" if error else "ok",
+                  "source": {k: v for k, v in item.items() if not k.startswith("_")}}
+        if error:
+            record["error"] = error
+        else:
+            record.update(requested=item["_parameters"]["num_questions"], generated=len(questions), questions=questions)
+        record["seconds"] = round(time.perf_counter() - started, 3)
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        out.flush()
+        os.fsync(out.fileno())
+        stats["failed" if error else "ok"] += 1
+        finished = stats["ok"] + stats["failed"]
+        if finished % 10 == 0:
+            print(f"{finished} done ({stats['failed']} failed, {stats['skipped']} skipped), "
+                  f"{finished / (time.perf_counter() - start):.2f} quizzes/s", file=sys.stderr)
+
+    # At most this many entries are held in memory at once, between reading the manifest
+    # and writing their result
+    window = 2 * concurrency
+    pending = {}
+    entries = read_manifest(manifest)
+    with ProcessPoolExecutor(max_workers=pdf_workers) as pdf_pool, ThreadPoolExecutor(max_workers=concurrency) as quiz_pool:
+        def submit_quiz(item, document=None):
+            pending[quiz_pool.submit(generate, item, item["_parameters"], document, use_cache)] = ("quiz", item)
+
+        def refill():
+            for item in entries:
+                if item["_id"] in done:
+                    stats["skipped"] += 1
+                    continue
+                started = time.perf_counter()
+                try:
+                    item["_parameters"] = validate(item, defaults)
+                except ValueError as e:
+                    write(item, started, error=str(e))
+                    continue
+                item["_started"] = started
+                if item.get("pdf"):
+                    pending[pdf_pool.submit(extract_pdf, item["pdf"])] = ("pdf", item)
+                else:
+                    submit_quiz(item)
+                if len(pending) >= window:
+                    return
+
+        try:
+            refill()
+            while pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    stage, item = pending.pop(future)
+                    started = item.pop("_started")
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        logger.warning("Entry %s failed", item["_id"], exc_info=True)
+                        write(item, started, error=f"{type(e).__name__}: {e}")
+                        continue
+                    if stage == "pdf":
+                        item["_started"] = started
+                        submit_quiz(item, result)
+                    else:
+                        write(item, started, result)
+                refill()
+        except KeyboardInterrupt:
+            for future in pending:
+                future.cancel()
+            print("Interrupted; run the same command again to resume.", file=sys.stderr)
+            raise
+        finally:
+            out.close()
+
+    print(f"{stats['ok']} quizzes generated, {stats['failed']} failed, {stats['skipped']} already done "
+          f"in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate quizzes for every entry of a manifest.")
+    parser.add_argument("manifest", help="JSONL (one object per line) or CSV manifest")
+    parser.add_argument("-o", "--output", required=True, help="JSONL file results are appended to; also the resume checkpoint")
+    parser.add_argument("--num-questions", type=int, default=10)
+    parser.add_argument("--quiz-type", default=quiz_service.QUIZ_TYPES[0], choices=quiz_service.QUIZ_TYPES)
+    parser.add_argument("--quiz-level", default="Medium", choices=quiz_service.QUIZ_LEVELS)
+    parser.add_argument("--language", default=quiz_service.LANGUAGES[0], choices=quiz_service.LANGUAGES)
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="quizzes generated at once")
+    parser.add_argument("--pdf-workers", type=int, default=PDF_WORKERS, help="processes extracting PDF text")
+    parser.add_argument("--fresh", action="store_true", help="bypass the response cache")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING"))
+    defaults = {"num_questions": args.num_questions, "quiz_type": args.quiz_type,
+                "quiz_level": args.quiz_level, "language": args.language}
+    try:
+        stats = run(args.manifest, args.output, defaults, args.concurrency, args.pdf_workers, not args.fresh)
+    except KeyboardInterrupt:
+        return 130
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
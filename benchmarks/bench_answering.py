@@ -0,0 +1,85 @@
+# Server-side cost of answering a quiz in the Streamlit app: script runs and CPU time
+# from the first answer to the graded result, measured with Streamlit's AppTest and
+# the offline fake model backend.
+#
+#   python benchmarks/bench_answering.py [--questions 50] [--page-size 10]
+#
+# AppTest re-executes the whole script for every interaction it simulates; in a browser,
+# answers inside a form are not sent until the form is submitted and page changes only
+# rerun the quiz fragment, so "script runs" here is an upper bound on the real work.
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+_scratch = tempfile.mkdtemp(prefix="quiz-bench-")
+os.environ.update({
+    "HOME": _scratch, "LANGCHAIN_API_KEY": "", "QUIZ_BACKEND": "fake", "FAKE_BACKEND_LATENCY": "0",
+    "FAKE_BACKEND_JITTER": "0", "QUESTION_BANK_WARMER": "0", "TELEMETRY_EXPORTER": "none", "LOG_LEVEL": "WARNING",
+})
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from streamlit.testing.v1 import AppTest
+
+
+def generate(questions):
+    at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=120).run()
+    at.sidebar.selectbox[0].select('Enter the Topic').run()
+    at.sidebar.text_input[0].input('Linear regression')
+    at.sidebar.slider[0].set_value(questions)
+    at.sidebar.selectbox[1].select('Multiple-Choice')
+    at.sidebar.selectbox[2].select('Medium')
+    at.sidebar.selectbox[3].select('English')
+    at.run()
+    at.sidebar.button[0].click().run()
+    return at
+
+
+def button(at, label):
+    return next((b for b in at.button if b.label == label), None)
+
+
+def answer_all(at):
+    # Picks the second option of every question, page by page; returns the script runs used
+    runs = 0
+    answered = set()
+    while True:
+        for radio in at.radio:
+            if radio.key not in answered:
+                answered.add(radio.key)
+                radio.set_value(radio.options[1])
+                # Outside a form every selection is its own script run
+                if not radio.form_id:
+                    at.run()
+                    runs += 1
+        next_page = button(at, "Next page")
+        if next_page is None:
+            break
+        next_page.click().run()
+        runs += 1
+    button(at, "Submit Answers").click().run()
+    return runs + 1, len(answered)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--questions", type=int, default=50)
+    parser.add_argument("--page-size", type=int, default=None, help="sets QUIZ_PAGE_SIZE")
+    args = parser.parse_args()
+    if args.page_size is not None:
+        os.environ["QUIZ_PAGE_SIZE"] = str(args.page_size)
+
+    at = generate(args.questions)
+    start_cpu, start = time.process_time(), time.perf_counter()
+    runs, answered = answer_all(at)
+    cpu, wall = time.process_time() - start_cpu, time.perf_counter() - start
+    score = next((m.value for m in at.markdown if "Your score is" in m.value), "")
+    print(f"{answered} answers: {runs} script runs, {cpu:.2f}s CPU ({cpu / answered * 1000:.1f}ms per answer), "
+          f"{wall:.2f}s wall, graded: {'yes' if score else 'no'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+# Grading and item statistics over a synthetic attempt log: the NumPy batch operations
+# in attempt_log against the same computation as a per-answer Python loop.
+#
+#   python benchmarks/bench_item_stats.py [--answers 1000000] [--items 2000] [--loop-answers 200000]
+#
+# Answers are simulated from a one-parameter logistic model, so harder items get lower
+# difficulty values and every item discriminates positively.
+
+import argparse
+import math
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("ATTEMPT_LOG_DIR", tempfile.mkdtemp(prefix="quiz-attempts-"))
+
+import numpy as np
+import pyarrow as pa
+
+import attempt_log
+
+
+def simulate(answers, items, quiz_length=10, options=4, seed=0):
+    rng = np.random.default_rng(seed)
+    attempts = answers // quiz_length
+    attempt = np.repeat(np.arange(attempts, dtype=np.int64), quiz_length)
+    item = rng.integers(0, items, attempts * quiz_length)
+    ability = rng.normal(size=attempts)[attempt]
+    hardness = rng.normal(size=items)[item]
+    answer = rng.integers(0, options, items).astype(np.int8)[item]
+    right = rng.random(len(item)) < 1 / (1 + np.exp(hardness - ability))
+    wrong = (answer + rng.integers(1, options, len(item))) % options
+    chosen = np.where(right, answer, wrong).astype(np.int8)
+    chosen[rng.random(len(item)) < 0.02] = -1
+    latency = rng.gamma(2.0, 10.0, len(item)).astype(np.float32)
+    return item, attempt, chosen, answer, latency
+
+
+def python_statistics(item, attempt, chosen, answer, max_options=attempt_log.MAX_OPTIONS):
+    # Reference implementation, one answer at a time
+    rows = list(zip(item.tolist(), attempt.tolist(), chosen.tolist(), answer.tolist()))
+    totals, lengths = defaultdict(int), defaultdict(int)
+    for _, a, c, k in rows:
+        totals[a] += c >= 0 and c == k
+        lengths[a] += 1
+    sums = defaultdict(lambda: [0, 0, 0.0, 0.0, 0.0, [0] * max_options])
+    for i, a, c, k in rows:
+        x = 1 if c >= 0 and c == k else 0
+        y = (totals[a] - x) / max(lengths[a] - 1, 1)
+        s = sums[i]
+        s[0] += 1
+        s[1] += x
+        s[2] += y
+        s[3] += x * y
+        s[4] += y * y
+        if c >= 0:
+            s[5][c] += 1
+    stats = {}
+    for i, (n, sx, sy, sxy, syy, counts) in sums.items():
+        spread = (n * sx - sx * sx) * (n * syy - sy * sy)
+        stats[i] = (sx / n, (n * sxy - sx * sy) / math.sqrt(spread) if spread > 0 else float("nan"),
+                    [count / n for count in counts])
+    return stats
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--answers", type=int, default=1_000_000)
+    parser.add_argument("--items", type=int, default=2000)
+    parser.add_argument("--loop-answers", type=int, default=200_000, help="answers the Python loop is timed on")
+    args = parser.parse_args()
+
+    item, attempt, chosen, answer, latency = simulate(args.answers, args.items)
+    correct, seconds = timed(attempt_log.grade, chosen, answer)
+    print(f"grade: {len(item):,} answers in {seconds * 1000:.1f}ms")
+    stats, seconds = timed(attempt_log.item_statistics, item, attempt, chosen, answer, latency)
+    print(f"item_statistics: {len(item):,} answers, {args.items} items in {seconds:.3f}s "
+          f"({len(item) / seconds / 1e6:.1f}M answers/s)")
+    print(f"  difficulty {np.nanmean(stats['difficulty']):.3f} mean, "
+          f"discrimination {np.nanmean(stats['discrimination']):.3f} mean")
+
+    # The Python loop on a prefix, checked against the batch result for the same rows
+    n = min(args.loop_answers, len(item))
+    reference, loop_seconds = timed(python_statistics, item[:n], attempt[:n], chosen[:n], answer[:n])
+    batch, batch_seconds = timed(attempt_log.item_statistics, item[:n], attempt[:n], chosen[:n], answer[:n])
+    for i, (difficulty, discrimination, rates) in reference.items():
+        assert math.isclose(difficulty, batch["difficulty"][i])
+        assert math.isclose(discrimination, batch["discrimination"][i], abs_tol=1e-9) or math.isnan(discrimination)
+        assert np.allclose(rates, batch["option_rates"][i])
+    print(f"python loop: {n:,} answers in {loop_seconds:.3f}s, batch {batch_seconds:.3f}s "
+          f"({loop_seconds / batch_seconds:.0f}x), results match")
+
+    # Round trip through the Parquet log
+    log = attempt_log.log
+    fingerprints = np.array([f"{i:040x}" for i in range(args.items)])
+    table = pa.table({
+        "attempt": attempt, "session_id": pa.array(attempt % 1000).cast(pa.string()).dictionary_encode(),
+        "fingerprint": pa.DictionaryArray.from_arrays(pa.array(item.astype(np.int32)), pa.array(fingerprints)),
+        "chosen": chosen, "answer": answer, "options": np.full(len(item), 4, dtype=np.int8),
+        "correct": correct, "latency": latency, "timestamp": np.zeros(len(item)),
+    }, schema=attempt_log.SCHEMA)
+    _, seconds = timed(log._write, table, "bench")
+    print(f"parquet write: {seconds:.3f}s, {sum(os.path.getsize(f) for f in log._files()) / len(item):.2f} bytes/answer")
+    (names, stored), seconds = timed(log.statistics)
+    print(f"parquet read + item_statistics: {seconds:.3f}s")
+    order = np.argsort(names)
+    assert np.allclose(stored["difficulty"][order], stats["difficulty"], equal_nan=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+# Compares the original serial get_pdf_text with the pdf_extract engine.
+#
+#   python benchmarks/bench_pdf_extract.py [--sizes 10 100 1000] [--workers N]
+
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyPDF2 import PdfReader
+import pdf_extract
+from synthetic import make_pdf
+
+
+def legacy_get_pdf_text(pdf_file):
+    # The implementation get_pdf_text had before the extraction engine
+    pdf_reader = PdfReader(pdf_file)
+    raw_text = ""
+    for page in pdf_reader.pages:
+        raw_text += page.extract_text()
+    return raw_text
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--workers", type=int, default=pdf_extract.WORKERS)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'pages':>6} {'legacy s':>10} {'serial s':>10} {'parallel s':>11} {'sample10 s':>11} {'speedup':>8}")
+    for size in args.sizes:
+        data = make_pdf(size)
+        assert pdf_extract.extract_text(data, workers=args.workers) == legacy_get_pdf_text(io.BytesIO(data))
+
+        legacy = best_of(lambda: legacy_get_pdf_text(io.BytesIO(data)), args.repeat)
+        serial = best_of(lambda: pdf_extract.extract_text(data, workers=1), args.repeat)
+        parallel = best_of(lambda: pdf_extract.extract_text(data, workers=args.workers), args.repeat)
+        sampled = best_of(lambda: pdf_extract.extract_text(data, max_pages=10, workers=args.workers), args.repeat)
+        print(f"{size:>6} {legacy:>10.3f} {serial:>10.3f} {parallel:>11.3f} {sampled:>11.3f} {legacy / parallel:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+# Microbenchmarks for the quiz pipeline's hot paths (pytest-benchmark).
+#
+#   python -m pytest benchmarks                                # saves JSON under .benchmarks/
+#   python -m pytest benchmarks --benchmark-compare            # compare with the last saved run
+#   python -m pytest benchmarks --benchmark-compare --benchmark-compare-fail=mean:10%
+
+import io
+import json
+
+import pytest
+
+import app
+import backends
+import dedup
+import grading
+import history_store
+import json_stream
+import pdf_extract
+import planner
+import prompts
+import quiz_service
+import summarizer
+import uploads
+from synthetic import make_pdf
+
+PDF_SIZES = [10, 50, 200]
+HISTORY_SIZES = [100, 1000, 10000]
+PARAMETERS = (10, 'Multiple-Choice', 'Medium', 'English')
+
+
+def fake_questions(count, seed=0):
+    fake = backends.FakeBackend(latency=0, jitter=0, seed=seed)
+    return json.loads(fake.generate(f"- **Number of Questions**: {count}"))
+
+
+@pytest.fixture(scope="module", params=PDF_SIZES, ids=lambda pages: f"{pages}pages")
+def pdf_bytes(request):
+    return make_pdf(request.param)
+
+
+@pytest.fixture(scope="module")
+def document_text():
+    return pdf_extract.extract_text(make_pdf(200), workers=1)
+
+
+@pytest.fixture(scope="module")
+def response_text():
+    return json.dumps(fake_questions(50))
+
+
+def test_pdf_extract_cold(benchmark, pdf_bytes):
+    benchmark(pdf_extract.extract_text, pdf_bytes, workers=1)
+
+
+def test_upload_spool(benchmark, pdf_bytes):
+    # io.BytesIO stands in for Streamlit's UploadedFile
+    benchmark(lambda: uploads.spool(io.BytesIO(pdf_bytes)).close())
+
+
+def test_get_pdf_text_cached(benchmark, pdf_bytes):
+    document = uploads.spool(io.BytesIO(pdf_bytes))
+    app.get_pdf_text(document)
+    benchmark(app.get_pdf_text, document)
+
+
+def test_prompt_pdf(benchmark, document_text):
+    def build():
+        contexts = planner.partition_context(document_text, len(planner.plan_batches(PARAMETERS[0])))
+        return [prompts.pdf_prompt(context, *PARAMETERS) for context in contexts]
+    benchmark(build)
+
+
+def test_split_sections(benchmark, document_text):
+    benchmark(summarizer.split_sections, document_text)
+
+
+def test_digest_cached_summaries(benchmark, document_text):
+    # Every section summary comes from the cache; only the digest is put together again
+    digester = summarizer.Summarizer(":memory:")
+    digester.digest(document_text)
+    benchmark(digester.digest, document_text)
+
+
+def test_prompt_pdf_digest(benchmark, document_text):
+    quiz_service.document_context(document_text, "bench")
+
+    def build():
+        context = quiz_service.document_context(document_text, "bench")
+        contexts = planner.partition_context(context, len(planner.plan_batches(PARAMETERS[0])))
+        return [prompts.pdf_prompt(context, *PARAMETERS) for context in contexts]
+    benchmark(build)
+
+
+def test_prompt_subject(benchmark):
+    benchmark(prompts.subject_prompt, 'Machine Learning', 'Supervised Learning', *PARAMETERS,
+              focus=planner.focus_note(0, 2), history="History of previously asked questions:\n- q")
+
+
+def test_prompt_topic(benchmark):
+    benchmark(prompts.topic_prompt, 'Neural networks', *PARAMETERS, focus=planner.focus_note(0, 2))
+
+
+def test_parse_response(benchmark, response_text):
+    benchmark(json.loads, response_text)
+
+
+def test_parse_truncated_response(benchmark, response_text):
+    benchmark(json_stream.salvage_array, response_text[:len(response_text) * 3 // 4])
+
+
+def test_parse_streamed_response(benchmark, response_text):
+    chunks = [response_text[i:i + 200] for i in range(0, len(response_text), 200)]
+    benchmark(lambda: list(json_stream.iter_json_array(chunks)))
+
+
+def test_parse_streamed_object(benchmark, response_text):
+    # A response holding one bare object instead of an array is complete, not salvaged
+    text = json.dumps(json.loads(response_text)[0])
+    chunks = [text[i:i + 50] for i in range(0, len(text), 50)]
+
+    def run():
+        parser = json_stream.JsonArrayParser()
+        items = [item for chunk in chunks for item in parser.feed(chunk)]
+        return parser, items
+    parser, items = run()
+    assert parser.complete and not parser.errors and len(items) == 1
+    benchmark(run)
+
+
+@pytest.mark.parametrize("history_size", HISTORY_SIZES, ids=lambda size: f"{size}history")
+def test_history_dedup(benchmark, history_size):
+    store = history_store.HistoryStore(":memory:")
+    history = history_store.SessionHistory(store, "bench")
+    history.add("topic:bench", fake_questions(history_size, seed=1))
+    batch = fake_questions(10, seed=2) + fake_questions(history_size, seed=1)[:10]
+    benchmark(lambda: [q for q in batch if not history.is_duplicate(q)])
+
+
+def test_batch_merge_dedup(benchmark):
+    # Merging concurrent batches into one index: 50 new questions, 10 exact repeats
+    # (different case and punctuation) and 10 near-duplicates (one word added)
+    questions = fake_questions(50)
+    repeats = [dict(q, question=q['question'].upper() + '!') for q in questions[:10]]
+    near = [dict(q, question=q['question'] + ' exactly') for q in questions[10:20]]
+    batch = questions + repeats + near
+
+    def run():
+        index = dedup.DedupIndex()
+        return [q for q in batch if index.add_if_new(q)]
+    assert len(run()) == len(questions)
+    benchmark(run)
+
+
+def test_grading(benchmark):
+    questions = fake_questions(50)
+    answers = {f"q{i+1}": q['options'][i % 4] for i, q in enumerate(questions)}
+    benchmark(grading.grade_answers, questions, answers)
+
+
+def test_end_to_end_stubbed_model(benchmark):
+    fake = backends.FakeBackend(latency=0, jitter=0)
+    build_prompt = lambda count, part, parts: prompts.topic_prompt('Neural networks', count, *PARAMETERS[1:], planner.focus_note(part, parts))
+
+    def run():
+        history = history_store.SessionHistory(history_store.HistoryStore(":memory:"), "bench")
+        questions = planner.generate_questions(20, build_prompt, fake.generate, is_duplicate=history.is_duplicate)
+        history.add("topic:neural networks", questions)
+        return grading.grade_answers(questions, {})
+    benchmark(run)
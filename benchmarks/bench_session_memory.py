@@ -0,0 +1,103 @@
+# Memory held per Streamlit session for a generated quiz and for the session's question
+# history index, measured with tracemalloc over many simulated sessions.
+#
+#   python benchmarks/bench_session_memory.py [--sessions 200] [--questions 50] [--shared 0.5] [--history 500]
+#
+# Quizzes are parsed from model-style JSON text, as the pipeline does; a --shared fraction
+# of the sessions receive the same cached quiz. "dicts" is the layout the app used to keep
+# (parsed question dicts, answers and timings keyed "q1", "q2", ...), "compact" the
+# quiz_items layout it keeps now.
+
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import backends
+import dedup
+import quiz_items
+
+PROMPT = "**Number of Questions**: {count}\n**Type of Quiz**: {quiz_type}\n**Topic**: {topic}"
+
+
+def quiz_texts(sessions, questions, shared, true_false=0.2):
+    backend = backends.FakeBackend(latency=0, jitter=0)
+    rng = random.Random(0)
+    popular = json.dumps(backend._questions(PROMPT.format(count=questions, quiz_type="Multiple-Choice", topic="popular"), rng))
+    texts = []
+    for i in range(sessions):
+        if rng.random() < shared:
+            texts.append(popular)
+        else:
+            quiz_type = "True-False" if rng.random() < true_false else "Multiple-Choice"
+            texts.append(json.dumps(backend._questions(PROMPT.format(count=questions, quiz_type=quiz_type, topic=i), rng)))
+    return texts
+
+
+def dict_state(text, rng):
+    questions = json.loads(text)
+    answers = {f"q{i+1}": rng.choice(q.get("options") or ["True", "False"]) for i, q in enumerate(questions)}
+    seconds = {f"q{i+1}": rng.random() * 30 for i in range(len(questions))}
+    return questions, answers, seconds
+
+
+def compact_state(text, rng):
+    questions = quiz_items.from_dicts(json.loads(text))
+    answers = quiz_items.new_answers(len(questions))
+    seconds = quiz_items.new_latencies(len(questions))
+    for i, q in enumerate(questions):
+        answers[i] = rng.randrange(len(q.choices))
+        seconds[i] = rng.random() * 30
+    return questions, answers, seconds
+
+
+def history_index(session, history):
+    backend = backends.FakeBackend(latency=0, jitter=0)
+    questions = backend._questions(PROMPT.format(count=history, quiz_type="Multiple-Choice", topic=session),
+                                   random.Random(session))
+    index = dedup.DedupIndex()
+    for q in questions:
+        index.add(q)
+    return index
+
+
+def measure(build, count):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = [build(i) for i in range(count)]
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del kept
+    return used / count
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--questions", type=int, default=50)
+    parser.add_argument("--shared", type=float, default=0.5, help="share of sessions served the same cached quiz")
+    parser.add_argument("--history", type=int, default=500, help="questions in each session's history index")
+    args = parser.parse_args()
+
+    texts = quiz_texts(args.sessions, args.questions, args.shared)
+    rng = random.Random(1)
+    for name, build in (("dicts", dict_state), ("compact", compact_state)):
+        per_session = measure(lambda i: build(texts[i], rng), args.sessions)
+        print(f"quiz state, {name:>7}: {per_session / 1024:8.1f} KiB per session "
+              f"({per_session / args.questions:.0f} bytes per question)")
+    sessions = max(1, args.sessions // 10)
+    per_session = measure(lambda i: history_index(i, args.history), sessions)
+    print(f"history index:       {per_session / 1024:8.1f} KiB per session "
+          f"({per_session / args.history:.0f} bytes per question)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+# Document digests with the offline fake model backend: time and model calls to summarize
+# documents of growing length, to rebuild the digest from cached summaries, and to re-digest
+# the document after one paragraph is edited; then quiz generation latency on the digest
+# against retrieval over the whole text.
+#
+#   python benchmarks/bench_summarize.py [--tokens 50000 250000 1000000] [--latency 0.2] [--questions 10]
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+_scratch = tempfile.mkdtemp(prefix="quiz-bench-")
+os.environ.update({
+    "HOME": _scratch, "LANGCHAIN_API_KEY": "", "QUIZ_BACKEND": "fake", "FAKE_BACKEND_JITTER": "0",
+    "QUESTION_BANK_WARMER": "0", "TELEMETRY_EXPORTER": "none", "LOG_LEVEL": "WARNING",
+    "MODEL_RATE_LIMIT": "1000", "MODEL_RATE_BURST": "1000",
+})
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import backends
+import history_store
+import quiz_service
+import summarizer
+
+
+def make_document(tokens, seed=0):
+    # Paragraphs of ~120 words drawn from the fake backend's vocabulary
+    rng = random.Random(seed)
+    paragraphs = []
+    size = 0
+    while size < tokens * 4:
+        paragraphs.append(f"Paragraph {len(paragraphs) + 1}. " + " ".join(rng.choice(backends._WORDS) for _ in range(120)) + ".")
+        size += len(paragraphs[-1]) + 1
+    return paragraphs
+
+
+def timed(fn, *args):
+    before = summarizer.digester.stats()["summarized"]
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start, summarizer.digester.stats()["summarized"] - before
+
+
+def quiz_seconds(text, questions, summaries):
+    quiz_service.DOCUMENT_SUMMARIES = summaries
+    history = history_store.SessionHistory(history_store.store, f"bench-{time.perf_counter()}")
+    start = time.perf_counter()
+    quiz_service.document_quiz(history, text, "bench", questions, "Multiple-Choice", "Medium", "English", use_cache=False)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens", type=int, nargs="+", default=[50000, 250000, 1000000])
+    parser.add_argument("--latency", type=float, default=0.2, help="fake model latency in seconds")
+    parser.add_argument("--questions", type=int, default=10)
+    args = parser.parse_args()
+    backends.backend.latency = args.latency
+
+    print(f"{'tokens':>9} {'sections':>8} {'digest':>7} {'cold s':>7} {'calls':>6} {'cached s':>8} {'calls':>6} "
+          f"{'edit s':>7} {'calls':>6} {'quiz s':>7} {'full-text quiz s':>16}")
+    for tokens in args.tokens:
+        paragraphs = make_document(tokens, seed=tokens)
+        text = "\n".join(paragraphs)
+        sections = len(summarizer.split_sections(text))
+        digest, cold, cold_calls = timed(summarizer.digester.digest, text)
+        _, cached, cached_calls = timed(summarizer.digester.digest, text)
+        paragraphs[len(paragraphs) // 2] = "An edited paragraph. " + paragraphs[len(paragraphs) // 2]
+        _, edit, edit_calls = timed(summarizer.digester.digest, "\n".join(paragraphs))
+        # Digest already stored for the document, as after its upload
+        quiz_service.document_context(text, "bench")
+        quiz = quiz_seconds(text, args.questions, True)
+        full = quiz_seconds(text, args.questions, False)
+        print(f"{tokens:>9} {sections:>8} {len(digest) // 4:>7} {cold:>7.2f} {cold_calls:>6} {cached:>8.2f} {cached_calls:>6} "
+              f"{edit:>7.2f} {edit_calls:>6} {quiz:>7.2f} {full:>16.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# Peak memory of turning an uploaded PDF into text, for scanned-book-sized synthetic
+# documents (every page carries a large uncompressed image):
+#   in-memory  the upload read whole and parsed with one PdfReader over all pages, as
+#              get_pdf_text did before uploads were spooled
+#   spooled    uploads.spool to a temporary file, page-limit check, then pdf_extract
+#              reading the file as it parses
+# Each run happens in a fresh process; the figure is peak RSS above the process's RSS
+# after imports.
+#
+#   python benchmarks/bench_upload_memory.py [--sizes 50 200] [--page-mb 1]
+
+import argparse
+import io
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from PyPDF2 import PdfReader
+
+import pdf_extract
+import uploads
+from synthetic import write_pdf
+
+
+def peak_rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def in_memory(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    reader = PdfReader(io.BytesIO(data))
+    text = ""
+    for page in reader.pages:
+        text += page.extract_text()
+    return text
+
+
+def spooled(path):
+    with open(path, "rb") as f:
+        document = uploads.spool(f, max_bytes=0)
+    uploads.check_pages(document, max_pages=0)
+    try:
+        return pdf_extract.extract_text(document.path, workers=1)
+    finally:
+        document.close()
+
+
+def child(strategy, path):
+    before = peak_rss()
+    text = {"in-memory": in_memory, "spooled": spooled}[strategy](path)
+    print(peak_rss() - before, len(text))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 200], help="document sizes in MB")
+    parser.add_argument("--page-mb", type=float, default=1.0, help="image size per page in MB")
+    parser.add_argument("--child", nargs=2, metavar=("STRATEGY", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(*args.child)
+        return
+
+    print(f"{'document':>10} {'pages':>6} {'in-memory MB':>13} {'spooled MB':>11}")
+    with tempfile.TemporaryDirectory() as scratch:
+        for size in args.sizes:
+            pages = max(1, int(size / args.page_mb))
+            path = os.path.join(scratch, f"{size}mb.pdf")
+            with open(path, "wb") as f:
+                write_pdf(f, pages, image_bytes=int(args.page_mb * 1024 * 1024))
+            results = {}
+            for strategy in ("in-memory", "spooled"):
+                out = subprocess.run([sys.executable, __file__, "--child", strategy, path],
+                                     check=True, capture_output=True, text=True).stdout.split()
+                results[strategy] = (int(out[0]), int(out[1]))
+            assert results["in-memory"][1] == results["spooled"][1]
+            print(f"{os.path.getsize(path) / 1024 / 1024:>8.0f}MB {pages:>6} "
+                  f"{results['in-memory'][0] / 1024 / 1024:>13.0f} {results['spooled'][0] / 1024 / 1024:>11.0f}")
+
+
+if __name__ == "__main__":
+    main()
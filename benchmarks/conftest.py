@@ -0,0 +1,20 @@
+import os
+import sys
+import tempfile
+
+# Configure the app's modules before they are imported: caches and stores go to a
+# throwaway directory and the model is the offline fake backend.
+_scratch = tempfile.mkdtemp(prefix="quiz-bench-")
+os.environ.setdefault("LANGCHAIN_API_KEY", "")
+os.environ.setdefault("QUIZ_BACKEND", "fake")
+os.environ.setdefault("FAKE_BACKEND_LATENCY", "0")
+os.environ.setdefault("QUESTION_BANK_WARMER", "0")
+os.environ.setdefault("TELEMETRY_EXPORTER", "none")
+os.environ.setdefault("PDF_CACHE_DIR", os.path.join(_scratch, "pdf_text"))
+os.environ.setdefault("RESPONSE_CACHE_PATH", os.path.join(_scratch, "responses.sqlite3"))
+os.environ.setdefault("QUESTION_BANK_PATH", os.path.join(_scratch, "question_bank.sqlite3"))
+os.environ.setdefault("HISTORY_STORE_PATH", os.path.join(_scratch, "history.sqlite3"))
+os.environ.setdefault("SUMMARY_CACHE_PATH", os.path.join(_scratch, "summaries.sqlite3"))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
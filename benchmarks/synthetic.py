@@ -0,0 +1,45 @@
+import io
+
+
+# Builds minimal, valid text PDFs so benchmarks need no fixture files. With image_bytes,
+# every page also carries an uncompressed image of about that size, like a scanned book.
+
+def _objects(num_pages, lines_per_page, image_bytes):
+    yield 1, b"<< /Type /Catalog /Pages 2 0 R >>"
+    kids = [4 + p * (3 if image_bytes else 2) for p in range(num_pages)]
+    yield 2, b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % k for k in kids) + b"] /Count %d >>" % num_pages
+    yield 3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"
+    num = 3
+    for p in range(num_pages):
+        lines = [f"Page {p + 1} line {i + 1}: gradient descent updates the weights using the gradient of the loss." for i in range(lines_per_page)]
+        stream = ("BT /F1 10 Tf 40 800 Td 12 TL " + " ".join(f"({line}) Tj T*" for line in lines) + " ET").encode("latin-1")
+        resources = b"/Font << /F1 3 0 R >>"
+        if image_bytes:
+            stream = b"q 595 0 0 842 0 0 cm /Im1 Do Q " + stream
+            resources += b" /XObject << /Im1 %d 0 R >>" % (num + 3)
+        yield num + 1, b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << %s >> /Contents %d 0 R >>" % (resources, num + 2)
+        yield num + 2, b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream"
+        if image_bytes:
+            side = max(1, int((image_bytes / 3) ** 0.5))
+            pixels = bytes((p * 7 + i) % 256 for i in range(side * 3)) * side
+            yield num + 3, (b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceRGB "
+                            b"/BitsPerComponent 8 /Length %d >>\nstream\n" % (side, side, len(pixels)) + pixels + b"\nendstream")
+        num += 3 if image_bytes else 2
+
+
+def write_pdf(out, num_pages, lines_per_page=40, image_bytes=0):
+    # Writes the document to a binary file object one object at a time
+    position = out.write(b"%PDF-1.4\n")
+    offsets = []
+    for num, obj in _objects(num_pages, lines_per_page, image_bytes):
+        offsets.append(position)
+        position += out.write(b"%d 0 obj\n" % num + obj + b"\nendobj\n")
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(offsets) + 1))
+    out.write(b"".join(b"%010d 00000 n \n" % offset for offset in offsets))
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(offsets) + 1, position))
+
+
+def make_pdf(num_pages, lines_per_page=40, image_bytes=0):
+    out = io.BytesIO()
+    write_pdf(out, num_pages, lines_per_page, image_bytes)
+    return out.getvalue()
@@ -0,0 +1,148 @@
+import hashlib
+import os
+import random
+import re
+import struct
+import sys
+from array import array
+
+
+# Question deduplication in two layers: an exact fingerprint of the normalized
+# question (case, whitespace, punctuation and option order do not matter) checked in
+# O(1), and MinHash signatures bucketed with LSH to catch paraphrased near-duplicates.
+THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.6"))
+NUM_PERM = 64
+SHINGLE_SIZE = 2
+
+_PUNCT_RE = re.compile(r"[^\w\s]", re.UNICODE)
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+def normalize_text(text):
+    return " ".join(_PUNCT_RE.sub(" ", str(text).lower()).split())
+
+
+def fingerprint(question):
+    options = sorted(normalize_text(o) for o in question.get("options") or [])
+    payload = "\x1f".join([normalize_text(question.get("question", ""))] + options)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def shingles(question):
+    # Word n-grams of the question, its options and its answer: two questions phrased
+    # from the same template but about different concepts differ in their options
+    fields = [question.get("question", ""), question.get("answer", "")] + list(question.get("options") or [])
+    result = set()
+    for field in fields:
+        words = normalize_text(field).split()
+        if len(words) < SHINGLE_SIZE:
+            result.add(" ".join(words))
+        result.update(" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1))
+    result.discard("")
+    return result or {""}
+
+
+def _lsh_params(num_perm, threshold):
+    # Pick bands x rows so that pairs at the threshold almost always share a bucket
+    # (candidate threshold ~ (1/bands) ** (1/rows) sits below the verified threshold)
+    best = (num_perm, 1)
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        if (1 / bands) ** (1 / rows) <= threshold * 0.8:
+            best = (bands, rows)
+    return best
+
+
+class DedupIndex:
+    def __init__(self, threshold=THRESHOLD, num_perm=NUM_PERM, seed=1):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands, self.rows = _lsh_params(num_perm, threshold)
+        rng = random.Random(seed)
+        self._perms = [(rng.randrange(1, _PRIME), rng.randrange(0, _PRIME)) for _ in range(num_perm)]
+        # Kept compact, since every session holds one: fingerprints as raw digests, all
+        # signatures in one flat array, and bucket keys and members as plain ints (a list
+        # only once a bucket has more than one member)
+        self._fingerprints = set()
+        self._signatures = array("I")
+        self._buckets = [{} for _ in range(self.bands)]
+        self.exact_hits = 0
+        self.near_hits = 0
+        self._nbytes = None
+
+    def __len__(self):
+        return len(self._fingerprints)
+
+    def nbytes(self):
+        # Approximate memory held, recomputed only after the index has grown
+        if self._nbytes is None or self._nbytes[0] != len(self):
+            size = sys.getsizeof(self._fingerprints) + sum(sys.getsizeof(fp) for fp in self._fingerprints)
+            size += sys.getsizeof(self._signatures)
+            for band in self._buckets:
+                size += sys.getsizeof(band) + sum(sys.getsizeof(key) + sys.getsizeof(members) for key, members in band.items())
+            self._nbytes = (len(self), size)
+        return self._nbytes[1]
+
+    def signature(self, question):
+        hashes = [struct.unpack("<I", hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest())[0] for s in shingles(question)]
+        return array("I", (min((a * h + b) % _PRIME & _MAX_HASH for h in hashes) for a, b in self._perms))
+
+    def _band_keys(self, signature):
+        return [int.from_bytes(signature[i * self.rows:(i + 1) * self.rows].tobytes(), "little") for i in range(self.bands)]
+
+    def _signature_at(self, position):
+        return self._signatures[position * self.num_perm:(position + 1) * self.num_perm]
+
+    def _similarity(self, a, b):
+        return sum(x == y for x, y in zip(a, b)) / self.num_perm
+
+    def is_duplicate(self, question, signature=None):
+        if bytes.fromhex(fingerprint(question)) in self._fingerprints:
+            self.exact_hits += 1
+            return True
+        if self.threshold >= 1:
+            return False
+
+        signature = signature or self.signature(question)
+        candidates = set()
+        for band, key in zip(self._buckets, self._band_keys(signature)):
+            members = band.get(key)
+            if isinstance(members, list):
+                candidates.update(members)
+            elif members is not None:
+                candidates.add(members)
+        for i in candidates:
+            if self._similarity(signature, self._signature_at(i)) >= self.threshold:
+                self.near_hits += 1
+                return True
+        return False
+
+    def add(self, question, signature=None):
+        fp = bytes.fromhex(fingerprint(question))
+        if fp in self._fingerprints:
+            return
+        self._fingerprints.add(fp)
+        if self.threshold >= 1:
+            return
+        signature = signature or self.signature(question)
+        position = len(self._signatures) // self.num_perm
+        self._signatures.extend(signature)
+        for band, key in zip(self._buckets, self._band_keys(signature)):
+            members = band.get(key)
+            if members is None:
+                band[key] = position
+            elif isinstance(members, list):
+                members.append(position)
+            else:
+                band[key] = [members, position]
+
+    def add_if_new(self, question):
+        # Returns True (and indexes the question) when it is neither an exact nor a near duplicate
+        signature = self.signature(question) if self.threshold < 1 else None
+        if self.is_duplicate(question, signature):
+            return False
+        self.add(question, signature)
+        return True
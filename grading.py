@@ -0,0 +1,18 @@
+# Grading kept free of Streamlit so the UI, benchmarks and other callers share it.
+
+def grade_answers(questions, user_answers):
+    # user_answers maps "q1", "q2", ... to the chosen option; returns (results, score)
+    results = []
+    score = 0
+    for i, q in enumerate(questions):
+        user_answer = user_answers.get(f"q{i+1}")
+        correct = user_answer == q['answer']
+        score += correct
+        results.append({
+            "question": q['question'],
+            "user_answer": user_answer,
+            "correct_answer": q['answer'],
+            "correct": correct,
+            "explanation": q.get('explanation', ''),
+        })
+    return results, score
@@ -0,0 +1,150 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import dedup
+import retrieval
+
+
+# Every question a user has been asked, persisted in a local SQLite file and indexed by
+# session, topic and fingerprint. Sessions keep only a bounded window of recent
+# questions in memory (for near-duplicate checks); everything else lives on disk.
+HISTORY_PATH = os.getenv("HISTORY_STORE_PATH", os.path.join(os.path.expanduser("~"), ".cache", "ai-quiz", "history.sqlite3"))
+# Recent questions per session kept in the in-memory near-duplicate index
+RECENT_WINDOW = int(os.getenv("HISTORY_RECENT_WINDOW", "500"))
+# Approximate tokens of previously asked questions added to a prompt
+PROMPT_TOKEN_BUDGET = int(os.getenv("HISTORY_PROMPT_TOKENS", "800"))
+
+
+class HistoryStore:
+    def __init__(self, path=HISTORY_PATH):
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS history (
+                id INTEGER PRIMARY KEY,
+                session_id TEXT NOT NULL,
+                topic TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                question TEXT NOT NULL,
+                created REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS history_session_fingerprint ON history (session_id, fingerprint);
+            CREATE INDEX IF NOT EXISTS history_session_topic ON history (session_id, topic, id);
+            CREATE INDEX IF NOT EXISTS history_fingerprint ON history (fingerprint);
+        """)
+
+    def add(self, session_id, topic, questions):
+        now = time.time()
+        rows = [(session_id, topic, dedup.fingerprint(q), json.dumps(q, ensure_ascii=False), now) for q in questions]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT INTO history (session_id, topic, fingerprint, question, created) VALUES (?, ?, ?, ?, ?)", rows)
+            self._conn.execute("COMMIT")
+
+    def seen(self, session_id, question):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM history WHERE session_id = ? AND fingerprint = ? LIMIT 1",
+                (session_id, dedup.fingerprint(question))).fetchone()
+        return row is not None
+
+    def count(self, session_id):
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM history WHERE session_id = ?", (session_id,)).fetchone()
+        return count
+
+    def recent(self, session_id, limit=RECENT_WINDOW, topic=None):
+        query = "SELECT question FROM history WHERE session_id = ?"
+        args = [session_id]
+        if topic is not None:
+            query += " AND topic = ?"
+            args.append(topic)
+        query += " ORDER BY id DESC LIMIT ?"
+        args.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, args).fetchall()
+        return [json.loads(question) for (question,) in rows]
+
+    def prompt_summary(self, session_id, topic, token_budget=PROMPT_TOKEN_BUDGET):
+        # Most recent question stems for this topic, newest first, within token_budget
+        lines = []
+        used = 0
+        for question in self.recent(session_id, limit=200, topic=topic):
+            line = "- " + " ".join(str(question.get("question", "")).split())[:200]
+            cost = retrieval.estimate_tokens(line)
+            if used + cost > token_budget:
+                break
+            lines.append(line)
+            used += cost
+        return "\n".join(lines)
+
+
+class SessionHistory:
+    # Per-session view: exact "seen before" checks go to the store, near-duplicate checks
+    # use an in-memory index over only the most recent questions, so memory stays flat.
+    # session_memory may spill the index to disk; it is loaded back on next use.
+    def __init__(self, store, session_id, window=RECENT_WINDOW):
+        self.store = store
+        self.session_id = session_id
+        self.window = window
+        self._lock = threading.Lock()
+        self._spill_store = None
+        self._load_index()
+
+    def _load_index(self):
+        self.index = dedup.DedupIndex()
+        for question in reversed(self.store.recent(self.session_id, limit=self.window)):
+            self.index.add(question)
+
+    def _spill_key(self):
+        return f"history:{self.session_id}"
+
+    def _loaded_index(self):
+        # Called with the lock held
+        if self.index is None:
+            self.index = self._spill_store.pop(self._spill_key())
+            if self.index is None:
+                self._load_index()
+        return self.index
+
+    def nbytes(self):
+        index = self.index
+        return index.nbytes() if index is not None else 0
+
+    def spill(self, spill_store):
+        # Writes the near-duplicate index to spill_store and drops it; returns the bytes freed
+        with self._lock:
+            if self.index is None:
+                return 0
+            freed = self.index.nbytes()
+            spill_store.put(self._spill_key(), self.index)
+            self._spill_store = spill_store
+            self.index = None
+        return freed
+
+    def is_duplicate(self, question):
+        with self._lock:
+            index = self._loaded_index()
+        return index.is_duplicate(question) or self.store.seen(self.session_id, question)
+
+    def add(self, topic, questions):
+        self.store.add(self.session_id, topic, questions)
+        with self._lock:
+            index = self._loaded_index()
+            for question in questions:
+                index.add(question)
+            if len(index) > 2 * self.window:
+                self._load_index()
+
+    def prompt_summary(self, topic):
+        return self.store.prompt_summary(self.session_id, topic)
+
+
+store = HistoryStore()
@@ -0,0 +1,84 @@
+import json
+
+
+# Incremental parser for a streamed JSON array of objects: each top-level object is
+# returned as soon as its closing brace arrives, without waiting for the whole array.
+class JsonArrayParser:
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._start = None
+        # Whether the payload is a single object rather than an array of them
+        self._bare = False
+        self.started = False
+        self.complete = False
+        self.items = 0
+        self.errors = 0
+
+    def feed(self, text):
+        self._buffer += text
+        found = []
+        buffer = self._buffer
+        i = self._pos
+        while i < len(buffer):
+            ch = buffer[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "[{":
+                if ch == "[" and not self.started:
+                    self.started = True
+                elif ch == "{" and self._depth == 1:
+                    self._start = i
+                elif ch == "{" and not self.started:
+                    # A bare object instead of an array; treat it as a one-element array
+                    self.started = True
+                    self._bare = True
+                    self._depth += 1
+                    self._start = i
+                self._depth += 1
+            elif ch in "]}":
+                self._depth -= 1
+                if ch == "}" and self._depth == 1 and self._start is not None:
+                    try:
+                        found.append(json.loads(buffer[self._start:i + 1]))
+                        self.items += 1
+                    except json.JSONDecodeError:
+                        self.errors += 1
+                    self._start = None
+                    if self._bare:
+                        # The root object closed, like the closing bracket of an array
+                        self._depth = 0
+                        self.complete = True
+                elif self._depth <= 0:
+                    self.complete = True
+            i += 1
+
+        # Drop everything already consumed so the buffer only holds the object in progress
+        keep = self._start if self._start is not None else i
+        self._buffer = buffer[keep:]
+        self._pos = i - keep
+        if self._start is not None:
+            self._start = 0
+        return found
+
+
+def iter_json_array(chunks):
+    parser = JsonArrayParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+
+
+def salvage_array(text):
+    # Every complete object in a malformed or truncated JSON array (e.g. a response cut
+    # off mid-object), instead of discarding the whole response
+    return JsonArrayParser().feed(text)
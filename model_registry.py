@@ -0,0 +1,180 @@
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+
+import google.generativeai as genai
+from google.api_core import exceptions as api_exceptions
+from google.generativeai import GenerativeModel, caching, client as genai_client
+
+import telemetry
+
+
+# One GenerativeModel per (model name, generation config), shared by every session in
+# the process instead of being rebuilt for each request.
+MODEL_NAME = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+# "grpc" (default) multiplexes all requests over one HTTP/2 channel; "rest" uses a pooled HTTP session
+TRANSPORT = os.getenv("GEMINI_TRANSPORT")
+# Prompt prefixes (instructions + document) of at least this many tokens are registered
+# with the provider's context cache; smaller ones are below the provider's minimum (32768
+# tokens for Gemini 1.5). Retrieval slices never get that large, so only documents sent
+# whole, up to CONTEXT_CACHE_MAX_TOKENS, are cached (see quiz_service.document_quiz).
+CONTEXT_CACHE_ENABLED = os.getenv("CONTEXT_CACHE", "1") == "1"
+CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("CONTEXT_CACHE_MIN_TOKENS", "32768"))
+CONTEXT_CACHE_MAX_TOKENS = int(os.getenv("CONTEXT_CACHE_MAX_TOKENS", "500000"))
+CONTEXT_CACHE_TTL = int(os.getenv("CONTEXT_CACHE_TTL", "3600"))
+# Seconds before a prefix whose cache could not be created (timeout, quota, outage) is tried again
+CONTEXT_CACHE_RETRY_SECONDS = int(os.getenv("CONTEXT_CACHE_RETRY_SECONDS", "300"))
+# Errors by which the provider refuses to cache for a model at all (unsupported, or its
+# minimum size is above ours); anything else is treated as transient
+CACHE_REFUSED_ERRORS = (api_exceptions.InvalidArgument, api_exceptions.FailedPrecondition)
+
+logger = logging.getLogger(__name__)
+
+
+class ModelRegistry:
+    def __init__(self, transport=TRANSPORT):
+        if transport:
+            genai.configure(transport=transport)
+        self._clients = {}
+        self._uses = {}
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+        # prefix key -> (model bound to the cached content, expiry timestamp); a None model
+        # marks a prefix whose cache could not be created, until the timestamp
+        self._cached_prefixes = {}
+        self._cache_create_lock = threading.Lock()
+        # Models the provider refused to create a cache for
+        self._uncacheable_models = set()
+        self.context_cache_hits = 0
+        self.context_cache_created = 0
+        self.context_cache_too_small = 0
+
+    @staticmethod
+    def _key(model_name, generation_config):
+        return model_name, json.dumps(generation_config or {}, sort_keys=True)
+
+    def get(self, model_name=MODEL_NAME, generation_config=None):
+        key = self._key(model_name, generation_config)
+        with self._lock:
+            model = self._clients.get(key)
+            if model is None:
+                model = GenerativeModel(model_name, generation_config=generation_config)
+                self._clients[key] = model
+                self._uses[key] = 0
+                self.created += 1
+            else:
+                self.reused += 1
+            self._uses[key] += 1
+        self._export()
+        return model
+
+    def can_cache(self, prefix_tokens, model_name=MODEL_NAME):
+        # Whether a prefix of this size is worth sending whole to be cached
+        with self._lock:
+            refused = model_name in self._uncacheable_models
+        return CONTEXT_CACHE_ENABLED and not refused and CONTEXT_CACHE_MIN_TOKENS <= prefix_tokens <= CONTEXT_CACHE_MAX_TOKENS
+
+    def get_for_prefix(self, prefix_key, prefix, prefix_tokens, generation_config=None, model_name=MODEL_NAME):
+        # Returns a model whose cached content already holds prefix, or None when the
+        # prefix should be sent inline with the request
+        model = self._get_for_prefix(prefix_key, prefix, prefix_tokens, generation_config, model_name)
+        self._export()
+        return model
+
+    def _get_for_prefix(self, prefix_key, prefix, prefix_tokens, generation_config, model_name):
+        if not CONTEXT_CACHE_ENABLED:
+            return None
+        with self._lock:
+            if model_name in self._uncacheable_models:
+                return None
+        if prefix_tokens < CONTEXT_CACHE_MIN_TOKENS:
+            with self._lock:
+                self.context_cache_too_small += 1
+            telemetry.count("context_cache_too_small")
+            return None
+        key = self._key(model_name, generation_config) + (prefix_key,)
+        entry = self._cached_entry(key)
+        if entry is not None:
+            return entry[0]
+
+        with self._cache_create_lock:
+            entry = self._cached_entry(key)
+            if entry is not None:
+                return entry[0]
+            try:
+                cached_content = caching.CachedContent.create(
+                    model=model_name, contents=[prefix], ttl=datetime.timedelta(seconds=CONTEXT_CACHE_TTL))
+                model = GenerativeModel.from_cached_content(cached_content, generation_config=generation_config)
+            except CACHE_REFUSED_ERRORS:
+                logger.warning("Context caching refused for %s; sending prompt prefixes inline", model_name, exc_info=True)
+                with self._lock:
+                    self._uncacheable_models.add(model_name)
+                return None
+            except Exception:
+                logger.warning("Creating a context cache failed; sending the prompt prefix inline for %ds",
+                               CONTEXT_CACHE_RETRY_SECONDS, exc_info=True)
+                with self._lock:
+                    self._cached_prefixes[key] = (None, time.time() + CONTEXT_CACHE_RETRY_SECONDS)
+                return None
+            with self._lock:
+                now = time.time()
+                for stale in [k for k, entry in self._cached_prefixes.items() if entry[1] < now]:
+                    del self._cached_prefixes[stale]
+                self._cached_prefixes[key] = (model, now + CONTEXT_CACHE_TTL)
+                self.context_cache_created += 1
+            return model
+
+    def _cached_entry(self, key):
+        # The live entry for a prefix, if any; a cache is only used while more than a minute
+        # of it remains, so a request never races the provider-side expiry
+        with self._lock:
+            entry = self._cached_prefixes.get(key)
+            if entry is None or entry[1] <= time.time() + (60 if entry[0] else 0):
+                return None
+            if entry[0] is not None:
+                self.context_cache_hits += 1
+            return entry
+
+    def warm(self, model_name=MODEL_NAME, generation_config=None):
+        # Build the model and open the shared transport before the first user request; once
+        # per model and config, as Streamlit calls this on every rerun
+        with self._lock:
+            if self._key(model_name, generation_config) in self._clients:
+                return
+        self.get(model_name, generation_config)
+        try:
+            genai_client.get_default_generative_client()
+        except Exception:
+            logger.warning("Opening the model transport failed; it is opened by the first request instead", exc_info=True)
+
+    def _export(self):
+        stats = self.stats()
+        telemetry.set_gauge("model_clients", stats["clients"])
+        telemetry.set_gauge("model_clients_created", stats["created"])
+        telemetry.set_gauge("model_clients_reused", stats["reused"])
+        telemetry.set_gauge("model_client_reuse_rate", stats["reuse_rate"])
+        telemetry.set_gauge("context_caches", stats["context_caches"])
+        telemetry.set_gauge("context_caches_created", stats["context_cache_created"])
+        telemetry.set_gauge("context_cache_hits", stats["context_cache_hits"])
+
+    def stats(self):
+        with self._lock:
+            total = self.created + self.reused
+            return {
+                "clients": len(self._clients),
+                "created": self.created,
+                "reused": self.reused,
+                "reuse_rate": self.reused / total if total else 0.0,
+                "context_caches": sum(1 for entry in self._cached_prefixes.values() if entry[0]),
+                "context_cache_created": self.context_cache_created,
+                "context_cache_hits": self.context_cache_hits,
+                "context_cache_too_small": self.context_cache_too_small,
+                "uses": {f"{name} {config}": uses for (name, config), uses in self._uses.items()},
+            }
+
+
+registry = ModelRegistry()
@@ -0,0 +1,136 @@
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+
+import telemetry
+
+
+# Extracted PDF text is cached by the SHA-256 of the uploaded bytes, so the same
+# file re-uploaded in any session (or re-read on a Streamlit rerun) skips PyPDF2.
+CACHE_DIR = os.getenv("PDF_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "ai-quiz", "pdf_text"))
+MEMORY_ITEMS = int(os.getenv("PDF_CACHE_MEMORY_ITEMS", "32"))
+# The in-memory tier is also capped in bytes; larger documents are served from disk
+MEMORY_MAX_BYTES = int(os.getenv("PDF_CACHE_MEMORY_BYTES", str(64 * 1024 * 1024)))
+DISK_MAX_BYTES = int(os.getenv("PDF_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+
+def content_key(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class PdfTextCache:
+    def __init__(self, cache_dir=CACHE_DIR, memory_items=MEMORY_ITEMS, disk_max_bytes=DISK_MAX_BYTES,
+                 memory_max_bytes=MEMORY_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.memory_items = memory_items
+        self.disk_max_bytes = disk_max_bytes
+        self.memory_max_bytes = memory_max_bytes
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.txt")
+
+    def get(self, key):
+        with self._lock:
+            text = self._memory.get(key)
+            if text is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+        if text is not None:
+            telemetry.count("pdf_cache_memory_hits")
+            return text
+
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                text = f.read()
+            # Touch the file so disk eviction is least-recently-used, not oldest-written
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            telemetry.count("pdf_cache_misses")
+            return None
+
+        with self._lock:
+            self.disk_hits += 1
+            self._remember(key, text)
+        telemetry.count("pdf_cache_disk_hits")
+        return text
+
+    def put(self, key, text):
+        with self._lock:
+            self._remember(key, text)
+
+        # Write to a temp file and rename so concurrent sessions never read a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self._evict_disk()
+
+    def _remember(self, key, text):
+        if key in self._memory:
+            self._memory_bytes -= sys.getsizeof(self._memory.pop(key))
+        self._memory[key] = text
+        self._memory_bytes += sys.getsizeof(text)
+        while self._memory and (len(self._memory) > self.memory_items or self._memory_bytes > self.memory_max_bytes):
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= sys.getsizeof(evicted)
+
+    def _evict_disk(self):
+        entries = []
+        total = 0
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if not entry.name.endswith(".txt"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    def stats(self):
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "hits": hits,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "memory_items": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+            }
+
+
+# Module-level instance: Streamlit re-executes app.py on every rerun, but imported
+# modules stay loaded, so this cache is shared by all reruns and sessions.
+cache = PdfTextCache()
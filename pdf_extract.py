@@ -0,0 +1,108 @@
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from PyPDF2 import PdfReader
+
+
+WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+# Below this many pages the process pool start-up costs more than it saves
+PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "32"))
+PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "16"))
+
+_worker_reader = None
+
+
+def _open_reader(source):
+    # source is either the raw PDF bytes or a path to the PDF on disk. A file is handed over
+    # open, so objects are read from it as they are parsed (given a path, PyPDF2 would read
+    # all of it into memory); the caller closes reader.stream.
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return PdfReader(io.BytesIO(source))
+    f = open(source, "rb")
+    try:
+        return PdfReader(f)
+    except BaseException:
+        f.close()
+        raise
+
+
+def _release(reader):
+    # Called after each range of pages: PyPDF2 caches every object it parses (content streams,
+    # fonts, images) for the life of the reader
+    reader.resolved_objects.clear()
+
+
+def _init_worker(source):
+    # Each worker parses the document structure once and reuses it for every range it is given
+    global _worker_reader
+    _worker_reader = _open_reader(source)
+
+
+def _extract_pages(indices):
+    try:
+        return [_worker_reader.pages[i].extract_text() or "" for i in indices]
+    finally:
+        _release(_worker_reader)
+
+
+def count_pages(source):
+    reader = _open_reader(source)
+    try:
+        return len(reader.pages)
+    finally:
+        reader.stream.close()
+
+
+def select_pages(num_pages, pages=None, max_pages=None):
+    # pages: a range/iterable of zero-based page indices to restrict extraction to
+    # max_pages: evenly sample at most this many pages from the selection
+    if pages is None:
+        indices = list(range(num_pages))
+    else:
+        indices = [i for i in pages if 0 <= i < num_pages]
+
+    if max_pages and len(indices) > max_pages:
+        step = len(indices) / max_pages
+        indices = [indices[int(k * step)] for k in range(max_pages)]
+    return indices
+
+
+def iter_pdf_pages(source, pages=None, max_pages=None, workers=WORKERS):
+    # Yields the text of each selected page, in page order. Parsed objects are released after
+    # every range of PAGES_PER_TASK pages, so memory stays bounded whatever the size of the file.
+    reader = _open_reader(source)
+    try:
+        indices = select_pages(len(reader.pages), pages, max_pages)
+        tasks = [indices[i:i + PAGES_PER_TASK] for i in range(0, len(indices), PAGES_PER_TASK)]
+        if workers <= 1 or len(indices) < PARALLEL_MIN_PAGES:
+            for task in tasks:
+                try:
+                    for i in task:
+                        yield reader.pages[i].extract_text() or ""
+                finally:
+                    _release(reader)
+            return
+    finally:
+        reader.stream.close()
+
+    # Keep only a bounded window of ranges in flight so a huge document is never
+    # fully materialised before the first pages are handed to the caller
+    window = workers * 2
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(source,)) as pool:
+        pending = [pool.submit(_extract_pages, task) for task in tasks[:window]]
+        next_task = len(pending)
+        try:
+            while pending:
+                texts = pending.pop(0).result()
+                if next_task < len(tasks):
+                    pending.append(pool.submit(_extract_pages, tasks[next_task]))
+                    next_task += 1
+                yield from texts
+        finally:
+            # The caller may stop early (e.g. once it has enough text); drop queued ranges
+            for future in pending:
+                future.cancel()
+
+
+def extract_text(source, pages=None, max_pages=None, workers=WORKERS):
+    return "".join(iter_pdf_pages(source, pages=pages, max_pages=max_pages, workers=workers))
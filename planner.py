@@ -0,0 +1,223 @@
+import contextvars
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import dedup
+import json_stream
+import retrieval
+import telemetry
+
+
+# Large quizzes are split into several smaller sub-requests that run concurrently,
+# so wall-clock latency stays close to that of a single small batch and a truncated
+# response only loses one batch instead of the whole quiz.
+BATCH_SIZE = int(os.getenv("QUIZ_BATCH_SIZE", "5"))
+MAX_CONCURRENCY = int(os.getenv("QUIZ_MAX_CONCURRENCY", "8"))
+TOP_UP_ROUNDS = int(os.getenv("QUIZ_TOP_UP_ROUNDS", "1"))
+
+logger = logging.getLogger(__name__)
+
+
+class SalvageStats:
+    # What recovering complete objects from malformed responses saved: every salvaged
+    # batch would otherwise have been thrown away and regenerated in full
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.salvaged_batches = 0
+        self.recovered_questions = 0
+        self.round_trips_saved = 0
+        self.tokens_saved = 0
+
+    def record(self, prompt, recovered):
+        with self._lock:
+            self.salvaged_batches += 1
+            self.recovered_questions += len(recovered)
+            self.round_trips_saved += 1
+            self.tokens_saved += retrieval.estimate_tokens(prompt) + retrieval.estimate_tokens(json.dumps(recovered))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "salvaged_batches": self.salvaged_batches,
+                "recovered_questions": self.recovered_questions,
+                "round_trips_saved": self.round_trips_saved,
+                "tokens_saved": self.tokens_saved,
+            }
+
+
+salvage_stats = SalvageStats()
+
+
+def record_salvage(prompt, response):
+    # Called once per upstream response by whoever made the call, not by every session
+    # parsing it: a response shared through single-flight was only salvaged once
+    recovered = _valid_questions(json_stream.salvage_array(response))
+    if recovered:
+        telemetry.count("salvaged_batches")
+        salvage_stats.record(prompt, recovered)
+
+
+def plan_batches(num_questions, batch_size=BATCH_SIZE, max_batches=MAX_CONCURRENCY):
+    # Split num_questions into at most max_batches near-equal batch sizes
+    parts = max(1, min(max_batches, -(-num_questions // batch_size)))
+    base, extra = divmod(num_questions, parts)
+    return [base + (1 if i < extra else 0) for i in range(parts)]
+
+
+def focus_note(part, parts):
+    if parts <= 1:
+        return ""
+    return (f"This request is part {part + 1} of {parts} of a larger quiz generated in parallel. "
+            f"Divide the subject into {parts} distinct subtopics and write these questions only about "
+            f"subtopic {part + 1}, so that the parts do not overlap.")
+
+
+def partition_context(text, parts, token_budget=retrieval.TOKEN_BUDGET):
+    # Give every sub-request its own slice of the document, each within token_budget
+    if parts <= 1 or retrieval.estimate_tokens(text) <= token_budget:
+        return [retrieval.select_context(text, token_budget)] * parts
+
+    index = retrieval.build_index(text)
+    used = set()
+    contexts = []
+    for _ in range(parts):
+        chosen = retrieval.select_chunks(text, token_budget, exclude=used)
+        if not chosen:
+            # The document ran out of unused chunks; reuse the best overall selection
+            chosen = retrieval.select_chunks(text, token_budget)
+        used.update(chosen)
+        contexts.append("\n...\n".join(index.chunks[i] for i in chosen))
+    return contexts
+
+
+def _valid_questions(parsed):
+    if isinstance(parsed, dict):
+        parsed = [parsed]
+    if not isinstance(parsed, list):
+        return []
+    return [q for q in parsed if isinstance(q, dict) and "question" in q and "answer" in q]
+
+
+def generate_questions(num_questions, build_prompt, generate, parse=json.loads, is_duplicate=None,
+                       top_up_generate=None, stream_generate=None, on_question=None, top_up_prompt=None):
+    # build_prompt(count, part, parts) -> prompt for one sub-request
+    # top_up_prompt(count, part, parts) -> prompt for shortfall requests (defaults to build_prompt)
+    # generate(prompt) -> raw model text
+    # is_duplicate(question) -> True for questions to drop (e.g. already in the history)
+    # top_up_generate(prompt) -> raw model text for shortfall requests (defaults to generate)
+    # stream_generate(prompt) -> iterator of text chunks; when given, questions are parsed
+    #   and accepted as soon as each object is complete instead of after the whole response
+    # on_question(question) -> called on the caller's thread for every accepted question
+    batches = plan_batches(num_questions)
+    parts = len(batches)
+    errors = []
+    # Workers only parse; merging, dedup and on_question all happen on the caller's thread
+    arrivals = queue.Queue()
+
+    def run(part, count, generate=generate, stream=stream_generate, build_prompt=build_prompt):
+        with telemetry.span("prompt"):
+            prompt = build_prompt(count, part, parts)
+        telemetry.count("prompt_chars", len(prompt))
+        telemetry.count("prompt_tokens", retrieval.estimate_tokens(prompt))
+        start = time.perf_counter()
+        if stream:
+            parser = json_stream.JsonArrayParser()
+            response_chars = 0
+            parse_seconds = 0.0
+            for chunk in stream(prompt):
+                response_chars += len(chunk)
+                parse_start = time.perf_counter()
+                items = parser.feed(chunk)
+                parse_seconds += time.perf_counter() - parse_start
+                for item in items:
+                    for q in _valid_questions(item):
+                        arrivals.put(q)
+            # Parsing is interleaved with the stream; the model stage gets the rest
+            telemetry.observe("model", time.perf_counter() - start - parse_seconds)
+            telemetry.observe("parse", parse_seconds)
+            telemetry.count("response_chars", response_chars)
+            if not parser.items:
+                telemetry.count("parse_failures")
+                errors.append(json.JSONDecodeError("No complete question object in response", "", 0))
+            elif not parser.complete or parser.errors:
+                # The stream was cut off or contained a broken object; what arrived is kept
+                telemetry.count("parse_failures")
+        else:
+            with telemetry.span("model"):
+                response = generate(prompt)
+            telemetry.count("response_chars", len(response))
+            with telemetry.span("parse"):
+                try:
+                    parsed = _valid_questions(parse(response))
+                except json.JSONDecodeError as e:
+                    telemetry.count("parse_failures")
+                    # Keep every complete question; the top-up below only asks for the rest
+                    parsed = _valid_questions(json_stream.salvage_array(response))
+                    if parsed:
+                        logger.info("Batch %d/%d: salvaged %d of %d questions from a malformed response",
+                                    part + 1, parts, len(parsed), count)
+                    else:
+                        errors.append(e)
+            for q in parsed:
+                arrivals.put(q)
+        logger.info("Batch %d/%d: %d questions, ~%d prompt tokens, %.2fs",
+                    part + 1, parts, count, retrieval.estimate_tokens(prompt), time.perf_counter() - start)
+
+    questions = []
+    # Catches exact and near-duplicate questions across the concurrent batches
+    seen = dedup.DedupIndex()
+    dedup_seconds = [0.0]
+
+    def merge(q):
+        if len(questions) >= num_questions:
+            return
+        dedup_start = time.perf_counter()
+        duplicate = (is_duplicate and is_duplicate(q)) or not seen.add_if_new(q)
+        dedup_seconds[0] += time.perf_counter() - dedup_start
+        if duplicate:
+            telemetry.count("dedup_drops")
+            return
+        questions.append(q)
+        if on_question:
+            on_question(q)
+
+    def drain(futures):
+        while True:
+            try:
+                merge(arrivals.get(timeout=0.05))
+            except queue.Empty:
+                if all(f.done() for f in futures):
+                    break
+        while not arrivals.empty():
+            merge(arrivals.get_nowait())
+        for f in futures:
+            # Re-raise anything other than a parse failure (network, quota, ...)
+            f.result()
+
+    def submit(pool, *args):
+        # Workers run in a copy of the caller's context, so their spans keep its input mode
+        return pool.submit(contextvars.copy_context().run, run, *args)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=parts) as pool:
+        drain([submit(pool, part, count) for part, count in enumerate(batches)])
+
+        # Fill any shortfall from truncated, failed or duplicate batches with one small follow-up request
+        for round_number in range(TOP_UP_ROUNDS):
+            missing = num_questions - len(questions)
+            if missing <= 0:
+                break
+            top_up = top_up_generate or generate
+            drain([submit(pool, round_number % parts, missing, top_up, None, top_up_prompt or build_prompt)])
+
+    telemetry.observe("dedup", dedup_seconds[0])
+    logger.info("Generated %d/%d questions in %d batches, %.2fs wall clock",
+                len(questions), num_questions, parts, time.perf_counter() - start)
+    if not questions and errors:
+        raise errors[0]
+    return questions
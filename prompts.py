@@ -0,0 +1,130 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+
+# All quiz prompts are rendered from one template in two parts:
+#   prefix - the static instructions, JSON schema and (for documents) the document body.
+#            It is identical for every quiz on the same content, so it can be registered
+#            once with the provider's context cache and reused across requests.
+#   suffix - the per-request parameters: count, type, level, language, focus and history.
+PREFIX_MEMO_SIZE = int(os.getenv("PROMPT_PREFIX_MEMO_SIZE", "64"))
+
+INSTRUCTIONS = """
+Using the following JSON schema, generate unique quiz questions based on the parameters given at the end of this prompt.
+The questions should be well-structured and cover a range of topics within {scope}
+{content}
+Depending on the selected quiz type, structure the questions as follows:
+
+1. **For Multiple Choice:**
+- Each question should have four possible answer options.
+- Include one correct answer.
+- Provide an explanation for the correct answer.
+
+2. **For True/False:**
+- Each question should be a true/false statement.
+- Indicate the correct answer (either "True" or "False").
+- Provide an explanation for the correct answer.
+
+Please provide the questions in the following JSON format:
+
+**For Multiple Choice:**
+[
+    {{
+        "question": "string",         # The quiz question text
+        "options": [                  # A list of four possible answer options
+            "option1",
+            "option2",
+            "option3",
+            "option4"
+        ],
+        "answer": "string",           # The correct answer option
+        "explanation": "string"       # A brief explanation for why the answer is correct
+    }},
+    ...
+]
+
+**For True/False:**
+[
+    {{
+        "question": "string",         # The true/false statement
+        "answer": "True/False",       # The correct answer (True or False)
+        "explanation": "string"       # A brief explanation for why the answer is correct
+    }},
+    ...
+]
+
+Notes:
+Ensure that all questions are unique and have not been asked before (refer to the history provided).
+The explanations should be clear and concise, providing context or additional information about the correct answer.
+Review and format the JSON response to ensure it matches the provided schema.
+"""
+
+PARAMETERS = """
+Selected parameters:
+{subject}- **Number of Questions**: {num_questions}
+- **Type of Quiz**: {quiz_type}
+- **Difficulty Level**: {quiz_level}
+- **Language**: {language}
+Ensure that none of the questions have been previously asked (refer to the provided history of questions).
+{focus}
+{history}
+"""
+
+
+class Prompt(str):
+    # A rendered prompt that still knows its cacheable prefix; everything that only needs
+    # the text (response cache keys, token estimates, the model call) can treat it as a str
+    def __new__(cls, prefix, prefix_key, suffix):
+        prompt = super().__new__(cls, prefix + suffix)
+        prompt.prefix = prefix
+        prompt.prefix_key = prefix_key
+        prompt.suffix = suffix
+        return prompt
+
+
+_prefix_memo = OrderedDict()
+_memo_lock = threading.Lock()
+
+
+def render_prefix(scope, content=""):
+    # Memoized by content hash, so repeated quizzes on the same document reuse the same
+    # rendered prefix (and the same provider cache key) instead of formatting it again
+    key = hashlib.sha256(f"{scope}\x1f{content}".encode("utf-8")).hexdigest()
+    with _memo_lock:
+        prefix = _prefix_memo.get(key)
+        if prefix is not None:
+            _prefix_memo.move_to_end(key)
+            return key, prefix
+    prefix = INSTRUCTIONS.format(scope=scope, content=f"\n{content}\n" if content else "")
+    with _memo_lock:
+        _prefix_memo[key] = prefix
+        while len(_prefix_memo) > PREFIX_MEMO_SIZE:
+            _prefix_memo.popitem(last=False)
+    return key, prefix
+
+
+def render_suffix(num_questions, quiz_type, quiz_level, language, subject="", focus="", history=""):
+    return PARAMETERS.format(subject=subject, num_questions=num_questions, quiz_type=quiz_type,
+                             quiz_level=quiz_level, language=language, focus=focus, history=history)
+
+
+def pdf_prefix(context):
+    return render_prefix("the following content:", context)
+
+
+def pdf_prompt(context, num_questions, quiz_type, quiz_level, language, focus="", history=""):
+    key, prefix = pdf_prefix(context)
+    return Prompt(prefix, key, render_suffix(num_questions, quiz_type, quiz_level, language, focus=focus, history=history))
+
+
+def subject_prompt(main_option, sub_option, num_questions, quiz_type, quiz_level, language, focus="", history=""):
+    key, prefix = render_prefix(f"{sub_option}.")
+    subject = f"- **Subject**: {main_option}\n- **Sub-field**: {sub_option}\n"
+    return Prompt(prefix, key, render_suffix(num_questions, quiz_type, quiz_level, language, subject, focus, history))
+
+
+def topic_prompt(topic, num_questions, quiz_type, quiz_level, language, focus="", history=""):
+    key, prefix = render_prefix(f"{topic}.")
+    return Prompt(prefix, key, render_suffix(num_questions, quiz_type, quiz_level, language, focus=focus, history=history))
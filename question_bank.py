@@ -0,0 +1,158 @@
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+import dedup
+
+
+# Pre-generated questions for the closed Data Science catalog, one pool per
+# (subject, sub-field, quiz type, level, language). "Generate Quiz" is served from the
+# pool and a background warmer tops pools back up, so the model is off the click path.
+BANK_PATH = os.getenv("QUESTION_BANK_PATH", os.path.join(os.path.expanduser("~"), ".cache", "ai-quiz", "question_bank.sqlite3"))
+LOW_WATERMARK = int(os.getenv("QUESTION_BANK_LOW_WATERMARK", "10"))
+HIGH_WATERMARK = int(os.getenv("QUESTION_BANK_HIGH_WATERMARK", "30"))
+WARM_INTERVAL = float(os.getenv("QUESTION_BANK_WARM_INTERVAL", "300"))
+WARMER_ENABLED = os.getenv("QUESTION_BANK_WARMER", "1") == "1"
+# Also fill pools nobody has asked for yet (one model call per catalog combination)
+PREWARM_CATALOG = os.getenv("QUESTION_BANK_PREWARM", "0") == "1"
+
+logger = logging.getLogger(__name__)
+
+
+def pool_key(params):
+    return "|".join(params)
+
+
+class QuestionBank:
+    def __init__(self, path=BANK_PATH):
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS questions (
+                id INTEGER PRIMARY KEY,
+                pool TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                created REAL NOT NULL,
+                UNIQUE (pool, fingerprint)
+            );
+            CREATE TABLE IF NOT EXISTS pools (
+                pool TEXT PRIMARY KEY,
+                params TEXT NOT NULL,
+                last_requested REAL NOT NULL
+            );
+        """)
+
+    def size(self, pool):
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM questions WHERE pool = ?", (pool,)).fetchone()
+            return count
+
+    def add(self, params, questions):
+        pool = pool_key(params)
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO questions (pool, fingerprint, payload, created) VALUES (?, ?, ?, ?)",
+                [(pool, dedup.fingerprint(q), json.dumps(q, ensure_ascii=False), now) for q in questions],
+            )
+            added = self._conn.total_changes - before
+            self._conn.execute("COMMIT")
+        return added
+
+    def take(self, params, count, is_duplicate=None):
+        # Removes and returns up to count questions from the pool, oldest first, skipping
+        # (but leaving in the pool for other users) questions is_duplicate rejects
+        pool = pool_key(params)
+        taken = []
+        taken_ids = []
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO pools (pool, params, last_requested) VALUES (?, ?, ?)"
+                " ON CONFLICT (pool) DO UPDATE SET last_requested = excluded.last_requested",
+                (pool, json.dumps(params), time.time()),
+            )
+            rows = self._conn.execute("SELECT id, payload FROM questions WHERE pool = ? ORDER BY id", (pool,))
+            for row_id, payload in rows:
+                question = json.loads(payload)
+                if is_duplicate and is_duplicate(question):
+                    continue
+                taken.append(question)
+                taken_ids.append((row_id,))
+                if len(taken) == count:
+                    break
+            self._conn.executemany("DELETE FROM questions WHERE id = ?", taken_ids)
+        return taken
+
+    def requested_pools(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT params FROM pools ORDER BY last_requested DESC").fetchall()
+        return [tuple(json.loads(params)) for (params,) in rows]
+
+
+class PoolWarmer:
+    # fill(params, count) -> list of question dicts, generated by the model
+    def __init__(self, bank, fill, catalog=()):
+        self.bank = bank
+        self.fill = fill
+        self.catalog = list(catalog)
+        self._requests = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="question-bank-warmer", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def request(self, params):
+        # Ask for a pool to be checked right away, e.g. after questions were taken from it
+        self._requests.put(tuple(params))
+
+    def refill(self, params):
+        size = self.bank.size(pool_key(params))
+        if size >= LOW_WATERMARK:
+            return 0
+        try:
+            added = self.bank.add(params, self.fill(params, HIGH_WATERMARK - size))
+        except Exception:
+            logger.exception("Refilling question pool %s failed", pool_key(params))
+            return 0
+        logger.info("Refilled question pool %s with %d questions", pool_key(params), added)
+        return added
+
+    def _run(self):
+        while True:
+            try:
+                params = self._requests.get(timeout=WARM_INTERVAL)
+            except queue.Empty:
+                # Periodic sweep: pools users have asked for first, then the rest of the catalog
+                sweep = self.bank.requested_pools()
+                sweep += [params for params in self.catalog if params not in sweep]
+                for params in sweep:
+                    self.refill(params)
+                continue
+            self.refill(params)
+
+
+bank = QuestionBank()
+_warmer = None
+_warmer_lock = threading.Lock()
+
+
+def start_warmer(fill, catalog=()):
+    # Idempotent: Streamlit re-runs the app script, but only one warmer runs per process
+    global _warmer
+    with _warmer_lock:
+        if _warmer is None and WARMER_ENABLED:
+            _warmer = PoolWarmer(bank, fill, catalog if PREWARM_CATALOG else ())
+            _warmer.start()
+            for params in _warmer.catalog:
+                _warmer.request(params)
+        return _warmer
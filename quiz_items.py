@@ -0,0 +1,95 @@
+import sys
+import threading
+import weakref
+from array import array
+
+import dedup
+
+
+# Questions as a session holds them: immutable and slotted, with interned option strings
+# and a precomputed fingerprint. Identical questions (a cached quiz served to many
+# sessions) are one shared object. Read access mirrors the dict a question is built from,
+# so grading, dedup and the attempt log take either.
+FIELDS = ("question", "options", "answer", "explanation")
+TRUE_FALSE = (sys.intern("True"), sys.intern("False"))
+
+
+class Question:
+    __slots__ = FIELDS + ("fingerprint", "__weakref__")
+
+    _shared = weakref.WeakValueDictionary()
+    _lock = threading.Lock()
+
+    def __init__(self, question, options, answer, explanation, fingerprint):
+        for name, value in zip(self.__slots__, (question, options, answer, explanation, fingerprint)):
+            object.__setattr__(self, name, value)
+
+    @classmethod
+    def from_dict(cls, data):
+        options = tuple(sys.intern(str(option)) for option in data.get("options") or ())
+        key = (str(data["question"]), options, sys.intern(str(data["answer"])), str(data.get("explanation", "")))
+        with cls._lock:
+            question = cls._shared.get(key)
+            if question is None:
+                question = cls._shared[key] = cls(*key, dedup.fingerprint(data))
+        return question
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Question is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("Question is immutable")
+
+    def __reduce__(self):
+        return Question.from_dict, (self.to_dict(),)
+
+    def __repr__(self):
+        return f"Question({self.question!r}, fingerprint={self.fingerprint[:12]!r})"
+
+    @property
+    def choices(self):
+        # The options shown for the question; True-False questions have none of their own
+        return self.options or TRUE_FALSE
+
+    def keys(self):
+        return FIELDS if self.options else ("question", "answer", "explanation")
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def __getitem__(self, key):
+        if key not in self.keys():
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return self[key] if key in self.keys() else default
+
+    def to_dict(self):
+        data = {key: self[key] for key in self.keys()}
+        if self.options:
+            data["options"] = list(self.options)
+        return data
+
+
+def from_dicts(questions):
+    return tuple(Question.from_dict(q) for q in questions)
+
+
+def new_answers(count):
+    # Chosen option index per question, -1 while unanswered
+    return array("b", [-1]) * count
+
+
+def new_latencies(count):
+    # Seconds spent per question
+    return array("f", [0.0]) * count
+
+
+def answer_map(questions, chosen):
+    # The "q1", "q2", ... -> chosen option mapping grading and the HTTP API use
+    return {f"q{i+1}": q.choices[c] if c >= 0 else None for i, (q, c) in enumerate(zip(questions, chosen))}
+
+
+def latency_map(latencies):
+    return {f"q{i+1}": round(seconds, 3) for i, seconds in enumerate(latencies)}
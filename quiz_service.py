@@ -0,0 +1,313 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import backends
+import dedup
+import history_store
+import model_registry
+import pdf_cache
+import pdf_extract
+import planner
+import prompts
+import question_bank
+import rate_limit
+import response_cache
+import retrieval
+import session_memory
+import singleflight
+import summarizer
+import telemetry
+import uploads
+
+
+# Quiz generation without any UI: the Streamlit app and the HTTP API (api.py) both call
+# these functions, so prompts, parsing, caching, dedup and history behave the same in both.
+# Evenly sample at most this many pages from uploaded PDFs (0 parses every page)
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "0"))
+# Quiz on a digest of section summaries for documents over DIGEST_TOKENS (see summarizer)
+DOCUMENT_SUMMARIES = os.getenv("DOCUMENT_SUMMARIES", "1") == "1"
+# Show questions while the model is still writing the rest of the quiz
+STREAM_QUESTIONS = os.getenv("STREAM_QUESTIONS", "1") == "1"
+# Sessions whose near-duplicate index stays in memory (the history itself is on disk)
+SESSION_CACHE_SIZE = int(os.getenv("QUIZ_SESSION_CACHE_SIZE", "1024"))
+
+QUIZ_TYPES = ('Multiple-Choice', 'True-False')
+QUIZ_LEVELS = ('Easy', 'Medium', 'Hard')
+LANGUAGES = ('English', 'Urdu')
+SUB_OPTIONS = {
+    'Machine Learning': ['Select.....', 'Supervised Learning', 'Unsupervised Learning', 'Semi-Supervised Learning', 'Reinforcement Learning'],
+    'Deep Learning': ['Select.....', 'Artificial Neural Networks (ANNs)', 'Convolutional Neural Networks (CNNs)', 'Recurrent Neural Networks (RNNs)'],
+    'Mathematics': ['Select.....', 'Linear Algebra', 'Calculus', 'Matrices', 'Vectors'],
+    'Statistics': ['Select.....', 'Descriptive', 'Probability', 'Inferential']
+}
+# Input modes as labelled in the sidebar (and in telemetry)
+DOCUMENT_MODE = 'Upload PDF/Text File'
+CATALOG_MODE = 'Data Science'
+TOPIC_MODE = 'Enter the Topic'
+
+MAX_QUESTIONS = 50
+
+GENERATION_CONFIG = {"response_mime_type": "application/json"}
+
+logger = logging.getLogger(__name__)
+
+
+def quiz_parameters(data):
+    # The sidebar's quiz parameters from a request or manifest entry; ValueError names the bad one
+    try:
+        num_questions = int(data.get("num_questions", 5))
+    except (TypeError, ValueError):
+        raise ValueError("num_questions must be an integer")
+    if not 1 <= num_questions <= MAX_QUESTIONS:
+        raise ValueError(f"num_questions must be between 1 and {MAX_QUESTIONS}")
+    for name, allowed in (("quiz_type", QUIZ_TYPES), ("quiz_level", QUIZ_LEVELS), ("language", LANGUAGES)):
+        if data.get(name) not in allowed:
+            raise ValueError(f"{name} must be one of {', '.join(allowed)}")
+    return dict(num_questions=num_questions, quiz_type=data["quiz_type"], quiz_level=data["quiz_level"], language=data["language"])
+
+def get_response_key(prompt):
+    return response_cache.cache_key(prompt, (backends.BACKEND, model_registry.MODEL_NAME, GENERATION_CONFIG))
+
+def cache_response(key, prompt, text):
+    # Runs once per upstream response, however many sessions share it
+    try:
+        # Only cache complete responses; a truncated array would be served again and again
+        json.loads(text)
+        response_cache.cache.put(key, text)
+    except json.JSONDecodeError:
+        planner.record_salvage(prompt, text)
+
+def _generate(key, prompt):
+    # Shared rate limit, fair queueing across sessions and retries with backoff
+    text = rate_limit.limiter.call(backends.backend.generate, prompt, GENERATION_CONFIG)
+    cache_response(key, prompt, text)
+    return text
+
+def _stream(key, prompt):
+    chunks = []
+    for chunk in rate_limit.limiter.stream(backends.backend.stream, prompt, GENERATION_CONFIG):
+        chunks.append(chunk)
+        yield chunk
+    cache_response(key, prompt, "".join(chunks))
+
+def get_gemini_response(prompt, use_cache=True):
+    key = get_response_key(prompt)
+    if not use_cache:
+        return _generate(key, prompt)
+    cached = response_cache.cache.get(key)
+    if cached is not None:
+        return cached
+    # Identical requests from other sessions already in flight share one upstream call;
+    # each session's own dedup runs on the shared questions afterwards
+    return singleflight.flights.do(key, lambda: _generate(key, prompt))
+
+def stream_gemini_response(prompt, use_cache=True):
+    # Yields the response text chunk by chunk as the model produces it
+    key = get_response_key(prompt)
+    if not use_cache:
+        return _stream(key, prompt)
+    cached = response_cache.cache.get(key)
+    if cached is not None:
+        return iter([cached])
+    return singleflight.flights.stream(key, lambda: _stream(key, prompt))
+
+def document_key(data):
+    # data: the PDF bytes, or an uploads.Document spooled to disk
+    if isinstance(data, uploads.Document):
+        return data.key
+    return pdf_cache.content_key(data)
+
+def document_text(data):
+    # Cache by content hash so reruns and re-uploads of the same file skip PyPDF2
+    key = document_key(data)
+    if PDF_MAX_PAGES:
+        key = f"{key}-max{PDF_MAX_PAGES}"
+    with telemetry.span("pdf_extract"):
+        raw_text = pdf_cache.cache.get(key)
+        if raw_text is None:
+            source = data.path if isinstance(data, uploads.Document) else data
+            raw_text = pdf_extract.extract_text(source, max_pages=PDF_MAX_PAGES or None)
+            pdf_cache.cache.put(key, raw_text)
+    return raw_text
+
+def whole_document_prefix(text):
+    # Documents within the provider's context cache limits are sent whole, once, as a cached
+    # prompt prefix; retrieval slices are always below the provider's minimum size. Only
+    # while that cache exists: without it every request would carry the whole document, so
+    # the document is then summarized and sliced like any other long one.
+    if backends.BACKEND != "gemini" or not model_registry.registry.can_cache(retrieval.estimate_tokens(text)):
+        return False
+    key, prefix = prompts.pdf_prefix(text)
+    return model_registry.registry.get_for_prefix(key, prefix, retrieval.estimate_tokens(prefix), GENERATION_CONFIG) is not None
+
+def document_context(text, session_id, fallback=True):
+    # The text quizzes on this document are generated from: the document itself, or its digest
+    # when it is too long for a prompt. Finished digests are cached next to the extracted text,
+    # by content hash and summarizer settings; the summaries behind them have their own cache.
+    if not DOCUMENT_SUMMARIES or not summarizer.digester.needs_digest(text) or whole_document_prefix(text):
+        return text
+    key = f"{pdf_cache.content_key(text.encode('utf-8'))}-digest-{summarizer.digester.version}"
+    with telemetry.span("summarize"):
+        digest = pdf_cache.cache.get(key)
+        if digest is None:
+            try:
+                # Summary calls queue under the session like its quiz requests
+                with rate_limit.session(session_id):
+                    digest = summarizer.digester.digest(text)
+            except Exception:
+                # Whatever the failure (rate limits, a blocked or empty response, an abandoned
+                # shared request), sections summarized so far stay cached and, unless the caller
+                # reports it itself, this quiz falls back to retrieval over the whole document
+                telemetry.count("summary_failures")
+                if not fallback:
+                    raise
+                logger.warning("Summarizing the document failed; using the full text", exc_info=True)
+                return text
+            pdf_cache.cache.put(key, digest)
+    return digest
+
+def get_catalog():
+    # Every (subject, sub-field, type, level, language) combination the Data Science branch can ask for
+    return [(main_option, sub_option, quiz_type, quiz_level, language)
+            for main_option, sub_options in SUB_OPTIONS.items()
+            for sub_option in sub_options[1:]
+            for quiz_type in QUIZ_TYPES
+            for quiz_level in QUIZ_LEVELS
+            for language in LANGUAGES]
+
+def fill_question_pool(params, count):
+    # Used by the question bank warmer, outside any user session
+    main_option, sub_option, quiz_type, quiz_level, language = params
+    build_prompt = lambda count, part, parts: prompts.subject_prompt(main_option, sub_option, count, quiz_type, quiz_level, language, planner.focus_note(part, parts))
+    with telemetry.mode("Question bank warmer"):
+        return planner.generate_questions(count, build_prompt, lambda prompt: get_gemini_response(prompt, use_cache=False))
+
+def start_warmer():
+    # Builds the shared model client (and opens its transport) ahead of the first quiz
+    if backends.BACKEND == "gemini":
+        model_registry.registry.warm(generation_config=GENERATION_CONFIG)
+    return question_bank.start_warmer(fill_question_pool, get_catalog())
+
+
+_sessions = OrderedDict()
+_sessions_lock = threading.Lock()
+
+
+def get_history(session_id):
+    # One SessionHistory per session id, shared by every request of that session
+    with _sessions_lock:
+        history = _sessions.get(session_id)
+        if history is None:
+            history = history_store.SessionHistory(history_store.store, session_id)
+            _sessions[session_id] = history
+            while len(_sessions) > SESSION_CACHE_SIZE:
+                _sessions.popitem(last=False)
+        else:
+            _sessions.move_to_end(session_id)
+    # Counted against the session's memory cap; spilled to disk when over it or idle
+    session_memory.manager.track(session_id, "history", history)
+    return history
+
+def get_history_block(history, topic):
+    summary = history.prompt_summary(topic)
+    return f"History of previously asked questions:\n{summary}" if summary else ""
+
+def generate_quiz(num_questions, build_prompt, topic, history, bank_params=None, use_cache=True, on_question=None):
+    # build_prompt(count, part, parts, history_block) returns the prompt for one concurrent sub-request.
+    # The session's history only goes into prompts that bypass the response cache: fresh
+    # quizzes and top-ups. Cacheable prompts stay the same for every session, so the response
+    # cache and request coalescing serve returning sessions too; questions they have already
+    # seen are dropped by the history check below and replaced by the top-up.
+    # topic: key the generated questions are filed under in the history store
+    # bank_params: catalog combination to serve from the question bank before calling the model
+    # on_question(question) is called for every question as soon as it is accepted
+    start = time.perf_counter()
+    first_question_at = []
+    unique_questions = []
+
+    def accept_question(q):
+        unique_questions.append(q)
+        if not first_question_at:
+            first_question_at.append(time.perf_counter() - start)
+        if on_question:
+            on_question(q)
+
+    if bank_params and use_cache:
+        for q in question_bank.bank.take(bank_params, num_questions, history.is_duplicate):
+            accept_question(q)
+        warmer = start_warmer()
+        if warmer:
+            warmer.request(bank_params)
+
+    # Live generation only covers what the bank could not
+    missing = num_questions - len(unique_questions)
+    if missing:
+        banked_index = dedup.DedupIndex()
+        for q in unique_questions:
+            banked_index.add(q)
+        try:
+            # Model calls queue under this session in the shared rate limiter
+            with rate_limit.session(history.session_id):
+                history_block = get_history_block(history, topic)
+                planner.generate_questions(
+                    missing, lambda count, part, parts: build_prompt(count, part, parts, "" if use_cache else history_block),
+                    lambda prompt: get_gemini_response(prompt, use_cache),
+                    is_duplicate=lambda q: history.is_duplicate(q) or banked_index.is_duplicate(q),
+                    # A top-up replaces questions that were truncated or already seen, so a cached
+                    # answer to the same prompt would not help
+                    top_up_generate=lambda prompt: get_gemini_response(prompt, use_cache=False),
+                    top_up_prompt=lambda count, part, parts: build_prompt(count, part, parts, history_block),
+                    stream_generate=(lambda prompt: stream_gemini_response(prompt, use_cache)) if STREAM_QUESTIONS else None,
+                    on_question=accept_question)
+        except (json.JSONDecodeError,) + rate_limit.RETRYABLE_ERRORS:
+            telemetry.count("failed_quizzes")
+            raise
+
+    total = time.perf_counter() - start
+    telemetry.observe("total", total)
+    if first_question_at:
+        telemetry.observe("first_question", first_question_at[0])
+    logger.info("Quiz of %d questions: first question after %.2fs, complete after %.2fs",
+                len(unique_questions), first_question_at[0] if first_question_at else total, total)
+    history.add(topic, unique_questions)
+    return unique_questions
+
+def document_quiz(history, text, key, num_questions, quiz_type, quiz_level, language, use_cache=True, on_question=None):
+    with telemetry.mode(DOCUMENT_MODE):
+        # Long documents are replaced by their digest (unless they can go whole into a cached
+        # prefix), so everything below depends on the number of questions, not the document length
+        context_text = document_context(text, history.session_id)
+        parts = len(planner.plan_batches(num_questions))
+        if whole_document_prefix(context_text):
+            # Every sub-request shares one prefix holding the whole document, which the provider
+            # caches; each then only sends its parameters and the subtopic to focus on
+            contexts = [context_text] * parts
+        else:
+            # Each concurrent sub-request gets its own slice of the most relevant,
+            # non-overlapping chunks that fit the token budget
+            with telemetry.span("retrieval"):
+                contexts = planner.partition_context(context_text, parts)
+        document_tokens = retrieval.estimate_tokens(text)
+        context_tokens = retrieval.estimate_tokens(contexts[0])
+        logger.info("PDF context: ~%d of ~%d document tokens per request (%.0f%% reduction)",
+                    context_tokens, document_tokens, 100 * (1 - context_tokens / document_tokens))
+        topic = f"pdf:{key}"
+        build_prompt = lambda count, part, parts, history_block: prompts.pdf_prompt(contexts[part], count, quiz_type, quiz_level, language, planner.focus_note(part, parts), history_block)
+        return generate_quiz(num_questions, build_prompt, topic, history, use_cache=use_cache, on_question=on_question)
+
+def catalog_quiz(history, main_option, sub_option, num_questions, quiz_type, quiz_level, language, use_cache=True, on_question=None):
+    with telemetry.mode(CATALOG_MODE):
+        bank_params = (main_option, sub_option, quiz_type, quiz_level, language)
+        topic = f"catalog:{question_bank.pool_key(bank_params)}"
+        build_prompt = lambda count, part, parts, history_block: prompts.subject_prompt(main_option, sub_option, count, quiz_type, quiz_level, language, planner.focus_note(part, parts), history_block)
+        return generate_quiz(num_questions, build_prompt, topic, history, bank_params, use_cache, on_question)
+
+def topic_quiz(history, topic, num_questions, quiz_type, quiz_level, language, use_cache=True, on_question=None):
+    with telemetry.mode(TOPIC_MODE):
+        topic_key = f"topic:{' '.join(topic.lower().split())}"
+        build_prompt = lambda count, part, parts, history_block: prompts.topic_prompt(topic, count, quiz_type, quiz_level, language, planner.focus_note(part, parts), history_block)
+        return generate_quiz(num_questions, build_prompt, topic_key, history, use_cache=use_cache, on_question=on_question)
@@ -0,0 +1,232 @@
+import contextlib
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+
+from google.api_core import exceptions as api_exceptions
+
+import singleflight
+import telemetry
+
+
+# Every model call in the process goes through one limiter:
+#   - a token bucket caps the request rate (MODEL_RATE_LIMIT per second, bursts of MODEL_RATE_BURST)
+#   - an AIMD limit caps calls in flight: +1 after a full window of fast successes, halved
+#     on a quota/availability error or a call slower than MODEL_LATENCY_TARGET seconds
+#   - waiting calls are served round-robin across sessions, so one large quiz cannot
+#     starve everyone else
+#   - quota and availability errors are retried with exponential backoff and full jitter
+RATE = float(os.getenv("MODEL_RATE_LIMIT", "10"))
+BURST = float(os.getenv("MODEL_RATE_BURST", "20"))
+INITIAL_CONCURRENCY = int(os.getenv("MODEL_CONCURRENCY_INITIAL", "8"))
+MIN_CONCURRENCY = int(os.getenv("MODEL_CONCURRENCY_MIN", "1"))
+MAX_CONCURRENCY = int(os.getenv("MODEL_CONCURRENCY_MAX", "64"))
+LATENCY_TARGET = float(os.getenv("MODEL_LATENCY_TARGET", "30"))
+MAX_RETRIES = int(os.getenv("MODEL_MAX_RETRIES", "4"))
+BACKOFF_BASE = float(os.getenv("MODEL_BACKOFF_BASE", "1.0"))
+BACKOFF_MAX = float(os.getenv("MODEL_BACKOFF_MAX", "30"))
+
+# A follower of an abandoned shared request (see singleflight) is told to try again as well
+RETRYABLE_ERRORS = (api_exceptions.ResourceExhausted, api_exceptions.ServiceUnavailable,
+                    api_exceptions.DeadlineExceeded, api_exceptions.InternalServerError,
+                    singleflight.FlightAbandoned)
+
+logger = logging.getLogger(__name__)
+
+_session = contextvars.ContextVar("model_session", default="background")
+
+
+@contextlib.contextmanager
+def session(session_id):
+    # Model calls made in this context (and in worker threads started with a copy of it)
+    # queue under session_id
+    token = _session.set(session_id)
+    try:
+        yield
+    finally:
+        _session.reset(token)
+
+
+class TokenBucket:
+    def __init__(self, rate=RATE, burst=BURST):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_take(self):
+        # Not locked: the limiter only calls it while holding its own lock
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    def wait_time(self):
+        self._refill()
+        return max(0.0, (1 - self._tokens) / self.rate)
+
+
+def backoff(attempt, base=BACKOFF_BASE, cap=BACKOFF_MAX):
+    # "Full jitter": uniform over [0, base * 2^attempt], capped
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class ModelLimiter:
+    def __init__(self, rate=RATE, burst=BURST, initial=INITIAL_CONCURRENCY, minimum=MIN_CONCURRENCY,
+                 maximum=MAX_CONCURRENCY, latency_target=LATENCY_TARGET, max_retries=MAX_RETRIES):
+        self.bucket = TokenBucket(rate, burst)
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_target = latency_target
+        self.max_retries = max_retries
+        self._cond = threading.Condition()
+        # session -> waiting tickets, in round-robin order
+        self._queues = OrderedDict()
+        self._last_decrease = 0.0
+        self.in_flight = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.granted = 0
+        self.retries = 0
+        self.throttled = 0
+        self.failures = 0
+        self.total_wait = 0.0
+
+    def _head(self):
+        for queue in self._queues.values():
+            return queue[0]
+        return None
+
+    def acquire(self, session_id=None):
+        session_id = session_id or _session.get()
+        ticket = object()
+        start = time.monotonic()
+        with self._cond:
+            self._queues.setdefault(session_id, deque()).append(ticket)
+            self.waiting += 1
+            self.max_waiting = max(self.max_waiting, self.waiting)
+            telemetry.set_gauge("model_queue_depth", self.waiting)
+            while True:
+                if self._head() is ticket and self.in_flight < int(self.limit):
+                    if self.bucket.try_take():
+                        break
+                    self._cond.wait(self.bucket.wait_time())
+                else:
+                    self._cond.wait()
+            queue = self._queues.pop(session_id)
+            queue.popleft()
+            if queue:
+                # The session goes to the back of the round-robin order
+                self._queues[session_id] = queue
+            self.waiting -= 1
+            self.in_flight += 1
+            self.granted += 1
+            waited = time.monotonic() - start
+            self.total_wait += waited
+            telemetry.set_gauge("model_queue_depth", self.waiting)
+            telemetry.set_gauge("model_in_flight", self.in_flight)
+            self._cond.notify_all()
+        telemetry.observe("rate_limit_wait", waited)
+
+    def release(self, latency=None, throttled=False):
+        # latency: seconds the call took when it succeeded; throttled: a quota or
+        # availability error, the signal to back off
+        with self._cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if throttled or (latency is not None and latency > self.latency_target):
+                # Multiplicative decrease, at most once per second so that one burst of
+                # failures from calls already in flight does not collapse the limit
+                if now - self._last_decrease > 1.0:
+                    self.limit = max(self.minimum, self.limit / 2)
+                    self._last_decrease = now
+                    logger.info("Model concurrency limit lowered to %d", int(self.limit))
+            elif latency is not None:
+                # Additive increase: about +1 per limit's worth of successful calls
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            telemetry.set_gauge("model_concurrency_limit", int(self.limit))
+            telemetry.set_gauge("model_in_flight", self.in_flight)
+            self._cond.notify_all()
+
+    def _retry_or_raise(self, attempt, error):
+        with self._cond:
+            self.throttled += 1
+        telemetry.count("model_throttled")
+        if attempt >= self.max_retries:
+            with self._cond:
+                self.failures += 1
+            raise error
+        delay = backoff(attempt)
+        with self._cond:
+            self.retries += 1
+        telemetry.count("model_retries")
+        logger.info("Model call failed with %s; retry %d/%d in %.1fs",
+                    type(error).__name__, attempt + 1, self.max_retries, delay)
+        time.sleep(delay)
+
+    def call(self, fn, *args, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            self.acquire()
+            start = time.monotonic()
+            try:
+                result = fn(*args, **kwargs)
+            except RETRYABLE_ERRORS as e:
+                self.release(throttled=True)
+                self._retry_or_raise(attempt, e)
+                continue
+            except BaseException:
+                self.release()
+                raise
+            self.release(time.monotonic() - start)
+            return result
+
+    def stream(self, fn, *args, **kwargs):
+        # Holds one slot until the stream ends; only retried if it fails before the first chunk
+        for attempt in range(self.max_retries + 1):
+            self.acquire()
+            start = time.monotonic()
+            started = False
+            try:
+                for chunk in fn(*args, **kwargs):
+                    started = True
+                    yield chunk
+            except RETRYABLE_ERRORS as e:
+                self.release(throttled=True)
+                if started:
+                    raise
+                self._retry_or_raise(attempt, e)
+                continue
+            except BaseException:
+                self.release()
+                raise
+            self.release(time.monotonic() - start)
+            return
+
+    def stats(self):
+        with self._cond:
+            return {
+                "limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "queue_depth": self.waiting,
+                "max_queue_depth": self.max_waiting,
+                "sessions_waiting": len(self._queues),
+                "granted": self.granted,
+                "mean_wait": self.total_wait / self.granted if self.granted else 0.0,
+                "retries": self.retries,
+                "throttled": self.throttled,
+                "failures": self.failures,
+            }
+
+
+limiter = ModelLimiter()
@@ -0,0 +1,132 @@
+import math
+import os
+import re
+from collections import Counter
+from functools import lru_cache
+
+
+# Local, network-free retrieval over extracted document text. The document is split
+# into chunks, indexed with BM25, and a diverse set of high-scoring chunks that fits
+# the token budget is selected for the prompt instead of the whole document.
+TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "6000"))
+CHUNK_TOKENS = int(os.getenv("RETRIEVAL_CHUNK_TOKENS", "300"))
+# 1.0 ranks purely by relevance, lower values favour chunks unlike those already picked
+MMR_LAMBDA = float(os.getenv("RETRIEVAL_MMR_LAMBDA", "0.7"))
+MAX_CANDIDATES = 200
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_STOPWORDS = frozenset("""
+a an and are as at be been but by can for from has have if in into is it its may more
+most not of on or other our such than that the their then there these they this those
+to was were which while will with would you your page
+""".split())
+
+
+def estimate_tokens(text):
+    # Rough, tokenizer-free estimate (about four characters per token for English)
+    return len(text) // 4 + 1
+
+
+def tokenize(text):
+    return [w for w in _WORD_RE.findall(text.lower()) if len(w) > 2 and w not in _STOPWORDS and not w.isdigit()]
+
+
+def split_chunks(text, chunk_tokens=CHUNK_TOKENS):
+    target_chars = chunk_tokens * 4
+    chunks = []
+    current = []
+    size = 0
+    for word in text.split():
+        current.append(word)
+        size += len(word) + 1
+        if size >= target_chars:
+            chunks.append(" ".join(current))
+            current = []
+            size = 0
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+class BM25Index:
+    def __init__(self, chunks, k1=1.5, b=0.75):
+        self.chunks = chunks
+        self.k1 = k1
+        self.b = b
+        self.term_freqs = [Counter(tokenize(chunk)) for chunk in chunks]
+        self.lengths = [sum(tf.values()) for tf in self.term_freqs]
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if chunks else 0.0
+        doc_freq = Counter()
+        for tf in self.term_freqs:
+            doc_freq.update(tf.keys())
+        n = len(chunks)
+        self.idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in doc_freq.items()}
+
+    def scores(self, query_terms):
+        scores = []
+        for tf, length in zip(self.term_freqs, self.lengths):
+            norm = self.k1 * (1 - self.b + self.b * length / (self.avg_length or 1))
+            score = 0.0
+            for term in query_terms:
+                freq = tf.get(term)
+                if freq:
+                    score += self.idf[term] * freq * (self.k1 + 1) / (freq + norm)
+            scores.append(score)
+        return scores
+
+    def salient_terms(self, n=40):
+        # Without a user query, the document's most characteristic terms act as one
+        totals = Counter()
+        for tf in self.term_freqs:
+            totals.update(tf)
+        weighted = {term: count * self.idf[term] for term, count in totals.items()}
+        return [term for term, _ in Counter(weighted).most_common(n)]
+
+
+@lru_cache(maxsize=16)
+def build_index(text, chunk_tokens=CHUNK_TOKENS):
+    return BM25Index(split_chunks(text, chunk_tokens))
+
+
+def _similarity(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def select_chunks(text, token_budget=TOKEN_BUDGET, query=None, mmr_lambda=MMR_LAMBDA, exclude=()):
+    # Returns indices (in document order) of the chunks chosen to fit token_budget
+    index = build_index(text)
+    query_terms = tokenize(query) if query else index.salient_terms()
+    scores = index.scores(query_terms)
+    top = max(scores) if scores else 0.0
+    relevance = [s / top if top else 0.0 for s in scores]
+    term_sets = [set(tf) for tf in index.term_freqs]
+
+    # MMR only needs to consider the strongest chunks; this keeps selection cheap on
+    # documents with thousands of chunks
+    excluded = set(exclude)
+    ranked = sorted((i for i in range(len(index.chunks)) if i not in excluded), key=lambda i: -relevance[i])
+    candidates = set(ranked[:MAX_CANDIDATES])
+    selected = []
+    used = 0
+    while candidates and token_budget - used >= min(estimate_tokens(index.chunks[i]) for i in candidates):
+        def mmr(i):
+            redundancy = max((_similarity(term_sets[i], term_sets[j]) for j in selected), default=0.0)
+            return mmr_lambda * relevance[i] - (1 - mmr_lambda) * redundancy
+
+        best = max(candidates, key=mmr)
+        candidates.discard(best)
+        cost = estimate_tokens(index.chunks[best])
+        if used + cost > token_budget:
+            continue
+        selected.append(best)
+        used += cost
+    return sorted(selected)
+
+
+def select_context(text, token_budget=TOKEN_BUDGET, query=None):
+    if estimate_tokens(text) <= token_budget:
+        return text
+    index = build_index(text)
+    return "\n...\n".join(index.chunks[i] for i in select_chunks(text, token_budget, query))
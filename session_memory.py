@@ -0,0 +1,243 @@
+import atexit
+import glob
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+import threading
+import time
+import weakref
+from array import array
+from collections import OrderedDict
+
+import pdf_cache
+import telemetry
+
+
+# Memory accounting for what each session keeps in the process. Components register under
+# their session id: spillable ones (a session's question history index) report nbytes(),
+# can spill(store) to a disk store and load back lazily on next use; others (the quiz a
+# session is answering, its upload) are only counted. A session over SESSION_MEMORY_LIMIT,
+# any session idle for SESSION_IDLE_SECONDS, and the least recently used sessions while all
+# of them together are over SESSION_MEMORY_TOTAL_LIMIT have their spillable components
+# written to disk. Totals are exported as gauges; report() has the full breakdown.
+SPILL_DIR = os.getenv("SESSION_SPILL_DIR", os.path.join(os.path.expanduser("~"), ".cache", "ai-quiz", "spill"))
+SESSION_LIMIT = int(os.getenv("SESSION_MEMORY_LIMIT", str(2 * 1024 * 1024)))
+TOTAL_LIMIT = int(os.getenv("SESSION_MEMORY_TOTAL_LIMIT", str(256 * 1024 * 1024)))
+IDLE_SECONDS = float(os.getenv("SESSION_IDLE_SECONDS", "600"))
+# Seconds between passes over all sessions; the session being used is checked every time
+SWEEP_INTERVAL = 5.0
+# Spill files left behind by processes that did not exit cleanly are removed after a day
+SPILL_MAX_AGE = 24 * 3600
+
+
+def deep_size(obj, seen=None):
+    # sys.getsizeof over containers, strings and slotted objects; shared objects count once
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (str, bytes, array, int, float)):
+        return size
+    if isinstance(obj, dict):
+        return size + sum(deep_size(k, seen) + deep_size(v, seen) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return size + sum(deep_size(item, seen) for item in obj)
+    for name in getattr(type(obj), "__slots__", ()):
+        if name != "__weakref__" and hasattr(obj, name):
+            size += deep_size(getattr(obj, name), seen)
+    return size
+
+
+def process_rss():
+    # Resident set size in bytes, where /proc is available
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class SpillStore:
+    # Pickled objects in files named after this process, removed when they are loaded back
+    def __init__(self, path=SPILL_DIR):
+        self.path = path
+        self._prefix = f"{os.getpid()}-"
+        os.makedirs(path, exist_ok=True)
+        for name in glob.glob(os.path.join(path, "*.pkl")):
+            try:
+                if time.time() - os.path.getmtime(name) > SPILL_MAX_AGE:
+                    os.remove(name)
+            except OSError:
+                continue
+
+    def _file(self, key):
+        return os.path.join(self.path, self._prefix + hashlib.sha1(key.encode("utf-8")).hexdigest() + ".pkl")
+
+    def put(self, key, obj):
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self._file(key))
+
+    def pop(self, key):
+        path = self._file(key)
+        try:
+            with open(path, "rb") as f:
+                obj = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        os.remove(path)
+        return obj
+
+    def nbytes(self):
+        return sum(os.path.getsize(name) for name in glob.glob(os.path.join(self.path, self._prefix + "*.pkl")))
+
+    def clear(self):
+        for name in glob.glob(os.path.join(self.path, self._prefix + "*.pkl")):
+            os.remove(name)
+
+
+class SessionMemory:
+    def __init__(self, store=None, session_limit=SESSION_LIMIT, total_limit=TOTAL_LIMIT, idle_seconds=IDLE_SECONDS):
+        self.store = store or SpillStore()
+        self.session_limit = session_limit
+        self.total_limit = total_limit
+        self.idle_seconds = idle_seconds
+        self._lock = threading.Lock()
+        # session id -> {name: weakref to a spillable component, or a byte count}, least recently used first
+        self._sessions = OrderedDict()
+        self._used = {}
+        self._last_sweep = 0.0
+        self.spills = 0
+        self.spilled_bytes = 0
+
+    def track(self, session_id, name, component):
+        # component: has nbytes() and spill(store) -> bytes freed; held weakly
+        with self._lock:
+            self._sessions.setdefault(session_id, {})[name] = weakref.ref(component)
+        self.touch(session_id)
+
+    def account(self, session_id, name, nbytes):
+        with self._lock:
+            self._sessions.setdefault(session_id, {})[name] = nbytes
+        self.touch(session_id)
+
+    def touch(self, session_id):
+        with self._lock:
+            if session_id in self._sessions:
+                self._sessions.move_to_end(session_id)
+            self._used[session_id] = time.monotonic()
+        self.enforce(session_id)
+
+    def _components(self, session_id):
+        # name -> (bytes in memory, the component if it can spill)
+        result = {}
+        for name, entry in list(self._sessions.get(session_id, {}).items()):
+            if isinstance(entry, int):
+                result[name] = (entry, None)
+                continue
+            component = entry()
+            if component is not None:
+                result[name] = (component.nbytes(), component)
+        return result
+
+    def _spill(self, session_id, components, target):
+        # Spills the largest components first until the session holds at most target bytes
+        held = sum(size for size, _ in components.values())
+        for name, (size, component) in sorted(components.items(), key=lambda item: -item[1][0]):
+            if held <= target:
+                break
+            if component is None or not size:
+                continue
+            freed = component.spill(self.store)
+            held -= freed
+            with self._lock:
+                self.spills += 1
+                self.spilled_bytes += freed
+            telemetry.count("session_spills")
+        return held
+
+    def _over_limit(self, components):
+        # Over the per-session limit, and able to get under it by spilling. When what cannot
+        # be spilled (a large upload) is over the limit by itself, spilling the rest would not
+        # help and the next request would only load it straight back.
+        fixed = sum(size for size, component in components.values() if component is None)
+        return fixed < self.session_limit < sum(size for size, _ in components.values())
+
+    def enforce(self, session_id=None):
+        now = time.monotonic()
+        if session_id is not None:
+            components = self._components(session_id)
+            if self._over_limit(components):
+                self._spill(session_id, components, self.session_limit)
+        with self._lock:
+            if now - self._last_sweep < SWEEP_INTERVAL:
+                return
+            self._last_sweep = now
+            sessions = list(self._sessions)
+        held = {}
+        for sid in sessions:
+            components = self._components(sid)
+            if not any(component for _, component in components.values()) and now - self._used.get(sid, now) > self.idle_seconds:
+                # Nothing left to spill and not used for a while: the session has most likely ended
+                with self._lock:
+                    self._sessions.pop(sid, None)
+                    self._used.pop(sid, None)
+                continue
+            if now - self._used.get(sid, now) > self.idle_seconds:
+                held[sid] = (self._spill(sid, components, 0), components)
+            elif self._over_limit(components):
+                held[sid] = (self._spill(sid, components, self.session_limit), components)
+            else:
+                held[sid] = (sum(size for size, _ in components.values()), components)
+        total = sum(size for size, _ in held.values())
+        # Least recently used sessions first
+        for sid, (size, components) in held.items():
+            if total <= self.total_limit:
+                break
+            total -= size - self._spill(sid, self._components(sid), 0)
+        self._export(total, held)
+
+    def _export(self, total, held):
+        telemetry.set_gauge("sessions_tracked", len(held))
+        telemetry.set_gauge("session_memory_bytes", total)
+        telemetry.set_gauge("session_memory_max_bytes", max((size for size, _ in held.values()), default=0))
+        telemetry.set_gauge("session_spill_bytes", self.store.nbytes())
+        telemetry.set_gauge("pdf_text_cache_bytes", pdf_cache.cache.stats()["memory_bytes"])
+        rss = process_rss()
+        if rss is not None:
+            telemetry.set_gauge("process_rss_bytes", rss)
+
+    def report(self):
+        with self._lock:
+            sessions = list(self._sessions)
+            spills, spilled_bytes = self.spills, self.spilled_bytes
+        now = time.monotonic()
+        breakdown = {}
+        for sid in sessions:
+            components = {name: size for name, (size, _) in self._components(sid).items()}
+            components["total"] = sum(components.values())
+            components["idle_seconds"] = round(now - self._used.get(sid, now), 1)
+            breakdown[sid] = components
+        return {
+            "sessions": breakdown,
+            "process": {
+                "sessions": len(breakdown),
+                "session_bytes": sum(s["total"] for s in breakdown.values()),
+                "largest_session_bytes": max((s["total"] for s in breakdown.values()), default=0),
+                "session_limit_bytes": self.session_limit,
+                "total_limit_bytes": self.total_limit,
+                "spill_bytes_on_disk": self.store.nbytes(),
+                "spills": spills,
+                "spilled_bytes": spilled_bytes,
+                "pdf_text_cache_bytes": pdf_cache.cache.stats()["memory_bytes"],
+                "rss_bytes": process_rss(),
+            },
+        }
+
+
+manager = SessionMemory()
+atexit.register(manager.store.clear)
@@ -0,0 +1,118 @@
+import threading
+
+import telemetry
+
+
+# In-flight request coalescing: while one call for a key is running, identical calls
+# wait for it and share its result instead of making their own upstream request.
+# Streamed results are shared chunk by chunk, so followers see questions as early as
+# the caller that made the request.
+class FlightAbandoned(RuntimeError):
+    # The caller making a shared request stopped before it finished (it is retryable, see
+    # rate_limit.RETRYABLE_ERRORS)
+    pass
+
+
+class _Flight:
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.chunks = []
+        self.done = False
+        self.error = None
+
+    def append(self, chunk):
+        with self.cond:
+            self.chunks.append(chunk)
+            self.cond.notify_all()
+
+    def finish(self, error=None):
+        with self.cond:
+            self.done = True
+            self.error = error
+            self.cond.notify_all()
+
+    def follow(self):
+        position = 0
+        while True:
+            with self.cond:
+                while position == len(self.chunks) and not self.done:
+                    self.cond.wait()
+                new = self.chunks[position:]
+                position = len(self.chunks)
+                done, error = self.done, self.error
+            yield from new
+            if done and position == len(self.chunks):
+                if error:
+                    raise error
+                return
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def _join(self, key):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.leaders += 1
+            else:
+                self.followers += 1
+            ratio = self.followers / (self.leaders + self.followers)
+        telemetry.count("model_requests")
+        if not leader:
+            telemetry.count("coalesced_requests")
+        telemetry.set_gauge("coalescing_ratio", round(ratio, 4))
+        return flight, leader
+
+    def _land(self, key, flight):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def stream(self, key, fn):
+        # fn() -> iterator of chunks, only called by the first caller for key
+        flight, leader = self._join(key)
+        if not leader:
+            yield from flight.follow()
+            return
+        try:
+            for chunk in fn():
+                flight.append(chunk)
+                yield chunk
+        except GeneratorExit:
+            flight.finish(FlightAbandoned("The shared request was abandoned before it finished"))
+            raise
+        except BaseException as e:
+            flight.finish(e)
+            raise
+        else:
+            flight.finish()
+        finally:
+            self._land(key, flight)
+
+    def do(self, key, fn):
+        # fn() -> result string, only called by the first caller for key. Nothing reaches the
+        # caller before the result is complete, so a follower whose leader gave up asks again.
+        try:
+            return "".join(self.stream(key, lambda: iter([fn()])))
+        except FlightAbandoned:
+            return "".join(self.stream(key, lambda: iter([fn()])))
+
+    def stats(self):
+        with self._lock:
+            total = self.leaders + self.followers
+            return {
+                "in_flight": len(self._flights),
+                "upstream_calls": self.leaders,
+                "coalesced": self.followers,
+                "coalescing_ratio": self.followers / total if total else 0.0,
+            }
+
+
+flights = SingleFlight()
@@ -0,0 +1,150 @@
+import contextvars
+import hashlib
+import logging
+import os
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import backends
+import model_registry
+import rate_limit
+import response_cache
+import retrieval
+import singleflight
+import telemetry
+
+
+# Documents too long for a prompt are reduced to a digest before quiz generation. The text is
+# split into sections, every section is summarized (in parallel), and while the summaries
+# together are still over DIGEST_TOKENS, runs of consecutive summaries are summarized again.
+# Section boundaries are chosen by the words themselves rather than by position, and every
+# summary is cached by the hash of the text it summarizes, so a re-uploaded document costs no
+# model calls and an edited one only re-summarizes the sections around the edit.
+DIGEST_TOKENS = int(os.getenv("DIGEST_TOKENS", str(4 * retrieval.TOKEN_BUDGET)))
+SECTION_TOKENS = int(os.getenv("SUMMARY_SECTION_TOKENS", "3000"))
+SUMMARY_TOKENS = int(os.getenv("SUMMARY_TOKENS", "200"))
+CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "8"))
+CACHE_PATH = os.getenv("SUMMARY_CACHE_PATH", os.path.join(os.path.expanduser("~"), ".cache", "ai-quiz", "summaries.sqlite3"))
+CACHE_TTL = int(os.getenv("SUMMARY_CACHE_TTL", str(90 * 24 * 3600)))
+CACHE_MAX_ENTRIES = int(os.getenv("SUMMARY_CACHE_MAX_ENTRIES", "100000"))
+
+GENERATION_CONFIG = {"response_mime_type": "text/plain"}
+# Average characters per word (with its space), used to aim content-defined boundaries
+WORD_CHARS = 6
+
+SUMMARY_PROMPT = """
+Summarize the following {kind} for someone who will write quiz questions about it.
+Keep the key facts, definitions, names, numbers and relationships; leave out examples, repetition and formatting.
+Write plain prose in the language of the text.
+- **Summary Length**: {words} words
+
+{text}
+"""
+
+logger = logging.getLogger(__name__)
+
+
+def group(items, target_chars, item_chars):
+    # Content-defined grouping: a group ends after an item whose hash (taken with the item
+    # before it) hits 1 in n once the group holds half of target_chars, and at twice
+    # target_chars regardless. An edit then only moves the boundaries next to it.
+    divisor = max(1, target_chars // 2 // item_chars)
+    groups = []
+    current = []
+    size = 0
+    previous = ""
+    for item in items:
+        current.append(item)
+        size += len(item) + 1
+        if size >= 2 * target_chars or (size >= target_chars // 2 and
+                                        zlib.crc32(f"{previous} {item}".encode("utf-8")) % divisor == 0):
+            groups.append(current)
+            current = []
+            size = 0
+        previous = item
+    if current:
+        groups.append(current)
+    return groups
+
+
+def split_sections(text, section_tokens=SECTION_TOKENS):
+    return [" ".join(words) for words in group(text.split(), section_tokens * 4, WORD_CHARS)]
+
+
+class Summarizer:
+    def __init__(self, cache_path=CACHE_PATH, digest_tokens=DIGEST_TOKENS, section_tokens=SECTION_TOKENS,
+                 summary_tokens=SUMMARY_TOKENS, concurrency=CONCURRENCY):
+        self.cache = response_cache.ResponseCache(cache_path, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES)
+        self.digest_tokens = digest_tokens
+        self.section_tokens = section_tokens
+        self.summary_tokens = summary_tokens
+        self.concurrency = concurrency
+        # Identifies everything that shapes a digest, for callers that store finished digests
+        self.version = hashlib.sha256(repr((backends.BACKEND, model_registry.MODEL_NAME, SUMMARY_PROMPT, digest_tokens,
+                                            section_tokens, summary_tokens)).encode("utf-8")).hexdigest()[:12]
+        self._lock = threading.Lock()
+        self.summarized = 0
+        self.cached = 0
+
+    def needs_digest(self, text):
+        return retrieval.estimate_tokens(text) > self.digest_tokens
+
+    def summarize(self, text, level=0):
+        kind = "part of a longer document" if level == 0 else "summaries of consecutive parts of a longer document"
+        prompt = SUMMARY_PROMPT.format(kind=kind, words=self.summary_tokens * 3 // 4, text=text)
+        key = response_cache.cache_key(prompt, (backends.BACKEND, model_registry.MODEL_NAME, GENERATION_CONFIG))
+        summary = self.cache.get(key)
+        if summary is not None:
+            with self._lock:
+                self.cached += 1
+            telemetry.count("summary_cache_hits")
+            return summary
+
+        def call():
+            summary = " ".join(rate_limit.limiter.call(backends.backend.generate, prompt, GENERATION_CONFIG).split())
+            self.cache.put(key, summary)
+            return summary
+        with self._lock:
+            self.summarized += 1
+        telemetry.count("summarized_sections")
+        # Sessions uploading the same document at once share each summary call
+        return singleflight.flights.do(f"summary:{key}", call)
+
+    def summarize_all(self, texts, level=0):
+        # In document order; workers run in a copy of the caller's context, so their model
+        # calls queue under the caller's session and their spans keep its input mode
+        if len(texts) == 1:
+            return [self.summarize(texts[0], level)]
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(texts)), thread_name_prefix="summary") as pool:
+            futures = [pool.submit(contextvars.copy_context().run, self.summarize, text, level) for text in texts]
+            return [future.result() for future in futures]
+
+    def digest(self, text):
+        start = time.perf_counter()
+        summaries = self.summarize_all(split_sections(text, self.section_tokens))
+        levels = 1
+        while len(summaries) > 1 and retrieval.estimate_tokens("\n\n".join(summaries)) > self.digest_tokens:
+            groups = group(summaries, self.section_tokens * 4, self.summary_tokens * 4)
+            if len(groups) == len(summaries):
+                break
+            summaries = self.summarize_all(["\n\n".join(g) for g in groups], levels)
+            levels += 1
+        digest = "\n\n".join(summaries)
+        logger.info("Digest of ~%d document tokens: ~%d tokens from %d summaries (depth %d), %.2fs",
+                    retrieval.estimate_tokens(text), retrieval.estimate_tokens(digest), len(summaries), levels,
+                    time.perf_counter() - start)
+        return digest
+
+    def stats(self):
+        with self._lock:
+            lookups = self.summarized + self.cached
+            return {
+                "summarized": self.summarized,
+                "cached": self.cached,
+                "hit_rate": self.cached / lookups if lookups else 0.0,
+            }
+
+
+digester = Summarizer()
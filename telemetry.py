@@ -0,0 +1,244 @@
+import contextlib
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    from opentelemetry import metrics as otel_metrics, trace as otel_trace
+except ImportError:
+    otel_metrics = otel_trace = None
+
+
+# Timing spans and counters for every stage of quiz generation, labelled with the input
+# mode ("Upload PDF/Text File", "Data Science", "Enter the Topic", ...). TELEMETRY_EXPORTER:
+#   prometheus - serve p50/p95/p99 summaries and counters on http://TELEMETRY_HOST:TELEMETRY_PORT/metrics (default)
+#   otel       - emit OpenTelemetry spans and metrics instead; the SDK and exporter are
+#                configured the usual way (opentelemetry-instrument, OTEL_* environment variables)
+#   none       - record in-process only (see snapshot())
+EXPORTER = os.getenv("TELEMETRY_EXPORTER", "prometheus")
+HOST = os.getenv("TELEMETRY_HOST", "127.0.0.1")
+PORT = int(os.getenv("TELEMETRY_PORT", "9464"))
+# Most recent observations per series used for the percentiles
+WINDOW = int(os.getenv("TELEMETRY_WINDOW", "1024"))
+QUANTILES = (0.5, 0.95, 0.99)
+
+logger = logging.getLogger(__name__)
+
+_mode = contextvars.ContextVar("quiz_mode", default="none")
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Metrics:
+    def __init__(self, window=WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        # (stage, mode) -> [recent durations, total seconds, count]
+        self._stages = {}
+        # (name, mode) -> value
+        self._counters = {}
+        # name -> current value, process-wide
+        self._gauges = {}
+
+    def observe(self, stage, seconds, mode=None):
+        key = (stage, mode or _mode.get())
+        with self._lock:
+            series = self._stages.get(key)
+            if series is None:
+                series = self._stages[key] = [deque(maxlen=self.window), 0.0, 0]
+            series[0].append(seconds)
+            series[1] += seconds
+            series[2] += 1
+
+    def count(self, name, value=1, mode=None):
+        key = (name, mode or _mode.get())
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name, value):
+        with self._lock:
+            self._gauges[name] = value
+
+    def snapshot(self):
+        with self._lock:
+            stages = {key: (list(samples), total, count) for key, (samples, total, count) in self._stages.items()}
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+        return {
+            "stages": {
+                f"{stage} [{mode}]": dict({f"p{int(q * 100)}": percentile(samples, q) for q in QUANTILES},
+                                          count=count, total=total)
+                for (stage, mode), (samples, total, count) in sorted(stages.items())
+            },
+            "counters": {f"{name} [{mode}]": value for (name, mode), value in sorted(counters.items())},
+            "gauges": dict(sorted(gauges.items())),
+        }
+
+    def render_prometheus(self):
+        with self._lock:
+            stages = {key: (list(samples), total, count) for key, (samples, total, count) in self._stages.items()}
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+
+        lines = ["# HELP quiz_stage_seconds Time spent in each quiz generation stage",
+                 "# TYPE quiz_stage_seconds summary"]
+        for (stage, mode), (samples, total, count) in sorted(stages.items()):
+            labels = f'stage="{_escape(stage)}",mode="{_escape(mode)}"'
+            for q in QUANTILES:
+                lines.append(f'quiz_stage_seconds{{{labels},quantile="{q}"}} {percentile(samples, q):.6f}')
+            lines.append(f"quiz_stage_seconds_sum{{{labels}}} {total:.6f}")
+            lines.append(f"quiz_stage_seconds_count{{{labels}}} {count}")
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f"# TYPE quiz_{name}_total counter")
+            for (counter, mode), value in sorted(counters.items()):
+                if counter == name:
+                    lines.append(f'quiz_{name}_total{{mode="{_escape(mode)}"}} {value}')
+        for name, value in sorted(gauges.items()):
+            lines.append(f"# TYPE quiz_{name} gauge")
+            lines.append(f"quiz_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+metrics = Metrics()
+
+
+class _OtelInstruments:
+    def __init__(self):
+        self.tracer = otel_trace.get_tracer("ai-quiz")
+        self._meter = otel_metrics.get_meter("ai-quiz")
+        self.duration = self._meter.create_histogram("quiz.stage.duration", unit="s",
+                                                     description="Time spent in each quiz generation stage")
+        self._counters = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def gauge(self, name):
+        # Synchronous gauges only exist in recent versions of the OpenTelemetry API
+        if not hasattr(self._meter, "create_gauge"):
+            return None
+        with self._lock:
+            gauge = self._gauges.get(name)
+            if gauge is None:
+                gauge = self._gauges[name] = self._meter.create_gauge(f"quiz.{name}")
+            return gauge
+
+    def counter(self, name):
+        with self._lock:
+            counter = self._counters.get(name)
+            if counter is None:
+                counter = self._counters[name] = self._meter.create_counter(f"quiz.{name}")
+            return counter
+
+
+_otel = None
+if EXPORTER == "otel":
+    if otel_trace is None:
+        logger.warning("TELEMETRY_EXPORTER=otel but opentelemetry is not installed; recording in-process only")
+    else:
+        _otel = _OtelInstruments()
+
+
+@contextlib.contextmanager
+def mode(name):
+    # Labels every span and counter recorded in this context (including worker threads
+    # started with a copy of it) with the quiz input mode
+    token = _mode.set(name)
+    try:
+        yield
+    finally:
+        _mode.reset(token)
+
+
+def set_mode(name):
+    # For the Streamlit script thread, which sets the mode again at the start of every run
+    _mode.set(name)
+
+
+def observe(stage, seconds):
+    metrics.observe(stage, seconds)
+    if _otel:
+        _otel.duration.record(seconds, {"stage": stage, "mode": _mode.get()})
+
+
+def count(name, value=1):
+    metrics.count(name, value)
+    if _otel:
+        _otel.counter(name).add(value, {"mode": _mode.get()})
+
+
+def set_gauge(name, value):
+    metrics.set_gauge(name, value)
+    gauge = _otel and _otel.gauge(name)
+    if gauge:
+        gauge.set(value)
+
+
+@contextlib.contextmanager
+def span(stage, **attributes):
+    start = time.perf_counter()
+    if _otel:
+        with _otel.tracer.start_as_current_span(f"quiz.{stage}", attributes=dict(attributes, mode=_mode.get())):
+            try:
+                yield
+            finally:
+                observe(stage, time.perf_counter() - start)
+    else:
+        try:
+            yield
+        finally:
+            observe(stage, time.perf_counter() - start)
+
+
+def snapshot():
+    return metrics.snapshot()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_exporter(host=HOST, port=PORT):
+    # Starts the Prometheus endpoint once per process (Streamlit reruns the script, not the module)
+    global _server
+    if EXPORTER != "prometheus" or not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer((host, port), _Handler)
+            except OSError:
+                logger.warning("Metrics endpoint %s:%d unavailable; recording in-process only", host, port, exc_info=True)
+                _server = False
+                return None
+            threading.Thread(target=_server.serve_forever, name="metrics-exporter", daemon=True).start()
+            logger.info("Serving quiz metrics on http://%s:%d/metrics", host, port)
+        return _server or None
@@ -0,0 +1,122 @@
+import hashlib
+import os
+import tempfile
+import weakref
+
+from PyPDF2.errors import PdfReadError
+
+import pdf_extract
+
+
+# Uploaded documents are spooled to a temporary file in small chunks, never held in memory
+# whole, and hashed on the way (the same SHA-256 key pdf_cache uses). Size is checked while
+# spooling and the page count before any text is extracted; extraction then reads objects
+# from the file as it needs them (see pdf_extract), so peak memory does not grow with the file.
+MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(200 * 1024 * 1024)))
+MAX_PAGES = int(os.getenv("UPLOAD_MAX_PAGES", "2000"))
+SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR") or None
+CHUNK_BYTES = 1024 * 1024
+
+
+class UploadError(ValueError):
+    pass
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class Document:
+    # A PDF on disk: path, size in bytes and content key. Spooled documents own their
+    # temporary file, which is removed by close() or once the document is garbage collected.
+    def __init__(self, path, size, key, owned=False):
+        self.path = path
+        self.size = size
+        self.key = key
+        self.pages = None
+        self._finalizer = weakref.finalize(self, _remove, path) if owned else None
+
+    @classmethod
+    def from_path(cls, path, max_bytes=MAX_BYTES):
+        size = os.path.getsize(path)
+        if max_bytes and size > max_bytes:
+            raise UploadError(too_large(size, max_bytes))
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_BYTES), b""):
+                digest.update(chunk)
+        return cls(path, size, digest.hexdigest())
+
+    def open(self):
+        return open(self.path, "rb")
+
+    def close(self):
+        if self._finalizer:
+            self._finalizer()
+
+
+class Spooler:
+    # Incremental spooling for callers that receive the upload in chunks (the HTTP API)
+    def __init__(self, max_bytes=MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._digest = hashlib.sha256()
+        self._file = tempfile.NamedTemporaryFile(prefix="upload-", suffix=".pdf", dir=SPOOL_DIR, delete=False)
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if self.max_bytes and self.size > self.max_bytes:
+            self.abort()
+            raise UploadError(too_large(self.size, self.max_bytes, partial=True))
+        self._digest.update(chunk)
+        self._file.write(chunk)
+
+    def abort(self):
+        self._file.close()
+        _remove(self._file.name)
+
+    def finish(self):
+        self._file.close()
+        if not self.size:
+            _remove(self._file.name)
+            raise UploadError("The upload is empty")
+        return Document(self._file.name, self.size, self._digest.hexdigest(), owned=True)
+
+
+def too_large(size, max_bytes, partial=False):
+    size = "" if partial else f"{size / 1024 / 1024:.1f} MB, "
+    return f"The file is {size}over the {max_bytes / 1024 / 1024:.0f} MB upload limit"
+
+
+def spool(fileobj, max_bytes=MAX_BYTES):
+    # Copies a readable binary file object (e.g. Streamlit's UploadedFile) to a temporary file;
+    # a file that reports its size is rejected before anything is copied
+    size = getattr(fileobj, "size", None)
+    if max_bytes and size and size > max_bytes:
+        raise UploadError(too_large(size, max_bytes))
+    spooler = Spooler(max_bytes)
+    try:
+        for chunk in iter(lambda: fileobj.read(CHUNK_BYTES), b""):
+            spooler.write(chunk)
+    except UploadError:
+        raise
+    except BaseException:
+        spooler.abort()
+        raise
+    return spooler.finish()
+
+
+def check_pages(document, max_pages=MAX_PAGES):
+    # Reads only the document structure; raises UploadError for unreadable or overlong PDFs
+    if document.pages is None:
+        try:
+            document.pages = pdf_extract.count_pages(document.path)
+        except (PdfReadError, ValueError, OSError) as e:
+            raise UploadError(f"The file could not be read as a PDF ({e})") from e
+    if max_pages and document.pages > max_pages:
+        raise UploadError(f"The document has {document.pages} pages; at most {max_pages} are accepted")
+    return document.pages
+